@@ -0,0 +1,76 @@
+"""Measure bytes on the wire and compression CPU cost for each route.
+
+Run from the repository root:
+
+    uv run python -m bench.compression
+"""
+
+import datetime
+import pathlib
+import tempfile
+import time
+import uuid
+
+import jour.app
+import jour.compress
+import jour.db
+import jour.models
+from bench.markdown_render import make_entry
+
+ROUTES = {
+    "month": ("GET", "/2024/03", None),
+    "day": ("GET", "/2024/03/05", None),
+    "search": ("POST", "/search", {"q": "lake"}),
+    "favicon": ("GET", "/favicon.svg", None),
+}
+REPEAT = 50
+
+
+def setup(path: pathlib.Path) -> None:
+    jour.app.pool = jour.db.Pool(str(path))
+    db = jour.app.pool.get()
+    jour.models.init(db)
+    settings = jour.models.settings.Settings(db)
+    settings.user_email = "bench@example.com"
+    jour.app.app.secret_key = settings.secret_key
+    start = datetime.date(2024, 1, 1)
+    for i in range(120):
+        jour.models.journals.upsert(
+            db,
+            {
+                "journal_id": uuid.uuid4(),
+                "journal_date": start + datetime.timedelta(days=i),
+                "journal_data": make_entry(2000 if i % 10 else 50_000, seed=i),
+            },
+        )
+    jour.app.pool.put(db)
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        setup(pathlib.Path(tmp) / "jour.db")
+        client = jour.app.app.test_client()
+        with client.session_transaction() as session:
+            session["email"] = "bench@example.com"
+        encodings = jour.compress._encodings()
+        print(f"{'route':<8} {'identity':>9}", end="")
+        for encoding in encodings:
+            print(f" {encoding + ' B':>9} {encoding + ' ms':>9}", end="")
+        print()
+        for route, (method, path, data) in ROUTES.items():
+            body = client.open(
+                path, method=method, data=data, headers={"Accept-Encoding": "identity"}
+            ).data
+            print(f"{route:<8} {len(body):9}", end="")
+            for factory in encodings.values():
+                start = time.process_time()
+                for _ in range(REPEAT):
+                    c = factory()
+                    compressed = c.compress(body) + c.flush()
+                elapsed = (time.process_time() - start) / REPEAT
+                print(f" {len(compressed):9} {elapsed * 1000:9.3f}", end="")
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Fill a database with years of synthetic journal entries.
+
+Run from the repository root:
+
+    uv run python -m bench.generate .local/bench.db --years 20
+
+The same seed always gives the same entries.
+"""
+
+import argparse
+import collections.abc
+import datetime
+import itertools
+import pathlib
+import random
+import time
+import uuid
+
+import jour.db
+import jour.models
+import jour.transfer
+from bench.markdown_render import make_entry
+
+END = datetime.date(2025, 12, 31)
+# Share of days that have an entry
+COVERAGE = 0.85
+EMAIL = "bench@example.com"
+
+
+def _entries(years: int, seed: int) -> collections.abc.Iterator[dict]:
+    rng = random.Random(seed)  # noqa: S311
+    day = END.replace(year=END.year - years) + datetime.timedelta(days=1)
+    while day <= END:
+        if rng.random() < COVERAGE:
+            # Mostly a few paragraphs, now and then a very long entry
+            size = min(int(rng.lognormvariate(7.3, 0.9)), 200_000)
+            yield {
+                "journal_id": uuid.UUID(int=rng.getrandbits(128), version=4),
+                "journal_date": day,
+                "journal_data": make_entry(max(size, 40), seed=rng.getrandbits(32)),
+            }
+        day += datetime.timedelta(days=1)
+
+
+def generate(path: pathlib.Path, years: int = 10, seed: int = 0) -> int:
+    """Create or refill the database at path and return the number of entries."""
+    db = jour.db.Database(str(path))
+    try:
+        jour.models.init(db)
+        settings = jour.models.settings.Settings(db)
+        settings.user_email = EMAIL
+        entries = _entries(years, seed)
+        count = 0
+        with jour.models.journals.deferred_merges(db):
+            while batch := list(itertools.islice(entries, jour.transfer.BATCH_SIZE)):
+                db.u("begin immediate")
+                try:
+                    jour.models.journals.bulk_upsert(db, batch)
+                    db.u("commit")
+                except BaseException:
+                    db.u("rollback")
+                    raise
+                count += len(batch)
+            jour.models.journals.optimize_indexes(db)
+        return count
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=pathlib.Path)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    args.path.parent.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    count = generate(args.path, args.years, args.seed)
+    print(f"{count} entries in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
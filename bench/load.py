@@ -0,0 +1,244 @@
+"""Measure latency and throughput of the main routes.
+
+Each route is driven through the Flask test client, one request at a time, and
+through a local waitress server by several clients at once. Results are
+compared with bench/baseline.json when it exists.
+
+Run from the repository root:
+
+    uv run python -m bench.load
+    uv run python -m bench.load --save
+
+Baselines only mean something on the machine they were saved on.
+"""
+
+import argparse
+import collections.abc
+import concurrent.futures
+import datetime
+import html
+import json
+import pathlib
+import random
+import re
+import statistics
+import tempfile
+import threading
+import time
+
+import httpx
+import waitress.server
+
+import jour.app
+import jour.db
+import jour.models
+from bench.generate import EMAIL, END, generate
+from bench.markdown_render import WORDS
+
+BASELINE = pathlib.Path(__file__).parent / "baseline.json"
+# The paging sentinel, not the date facets, which post to /search too
+NEXT_PAGE = re.compile(r'hx-post="(/search\?[^"]*after_rank=[^"]*)"')
+
+# (method, path, form data); a request factory gets a random generator and
+# returns one of these
+Request = tuple[str, str, dict | None]
+
+
+def _compare(results: dict, baseline: dict) -> None:
+    print(
+        f"{'mode':<8} {'route':<12} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>8}"
+        f"   vs baseline: {'p50':>7} {'p99':>7} {'req/s':>7}"
+    )
+    for mode, routes in results.items():
+        for route, r in routes.items():
+            line = (
+                f"{mode:<8} {route:<12} {r['p50_ms']:9.2f} {r['p99_ms']:9.2f} "
+                f"{r['rps']:8.1f}"
+            )
+            b = baseline.get(mode, {}).get(route)
+            if b:
+                deltas = [
+                    (r[k] - b[k]) / b[k] * 100 if b[k] else 0.0
+                    for k in ("p50_ms", "p99_ms", "rps")
+                ]
+                line += "                 " + " ".join(f"{d:+6.1f}%" for d in deltas)
+            print(line)
+
+
+def _day(rng: random.Random, years: int) -> datetime.date:
+    return END - datetime.timedelta(days=rng.randrange(years * 365))
+
+
+def _query(rng: random.Random) -> str:
+    # Two words, the second a prefix, so most queries are not in the cache
+    return f"{rng.choice(WORDS)} {rng.choice(WORDS)[:3]}"
+
+
+def _requests(
+    years: int, next_page: collections.abc.Callable[[str], str | None]
+) -> dict[str, collections.abc.Callable[[random.Random], Request]]:
+    def month(rng: random.Random) -> Request:
+        return "GET", _day(rng, years).strftime("/%Y/%m"), None
+
+    def day(rng: random.Random) -> Request:
+        return "GET", _day(rng, years).strftime("/%Y/%m/%d"), None
+
+    def search(rng: random.Random) -> Request:
+        return "POST", "/search", {"q": _query(rng)}
+
+    def search_page(rng: random.Random) -> Request:
+        q = _query(rng)
+        path = next_page(q) or "/search"
+        return "POST", path, {"q": q}
+
+    def update(rng: random.Random) -> Request:
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 400)))
+        return (
+            "POST",
+            _day(rng, years).strftime("/%Y/%m/%d/update"),
+            {"entry-text": text},
+        )
+
+    return {
+        "month": month,
+        "day": day,
+        "search": search,
+        "search_page": search_page,
+        "update": update,
+    }
+
+
+def _summary(latencies: list[float], elapsed: float) -> dict[str, float]:
+    q = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "p50_ms": round(q[49] * 1000, 3),
+        "p99_ms": round(q[98] * 1000, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def run_client(factories: dict, n: int, seed: int) -> dict[str, dict[str, float]]:
+    """Send n requests per route through the test client, one at a time."""
+    client = jour.app.app.test_client()
+    with client.session_transaction() as session:
+        session["email"] = EMAIL
+    results = {}
+    for route, factory in factories.items():
+        rng = random.Random(seed)  # noqa: S311
+        requests = [factory(rng) for _ in range(n)]
+        latencies = []
+        started = time.perf_counter()
+        for method, path, data in requests:
+            t = time.perf_counter()
+            # Buffered, so the time includes rendering the streamed body
+            response = client.open(path, method=method, data=data, buffered=True)
+            latencies.append(time.perf_counter() - t)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {path}: {response.status_code}")
+        results[route] = _summary(latencies, time.perf_counter() - started)
+    return results
+
+
+def run_waitress(
+    factories: dict, n: int, seed: int, concurrency: int, threads: int
+) -> dict[str, dict[str, float]]:
+    """Send n requests per route to a local waitress server from several clients."""
+    server = waitress.server.create_server(
+        jour.app.app, host="127.0.0.1", port=0, threads=threads
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.effective_port}"
+    # Sign in through the test client and send its session cookie
+    test_client = jour.app.app.test_client()
+    with test_client.session_transaction() as session:
+        session["email"] = EMAIL
+    name = jour.app.app.config["SESSION_COOKIE_NAME"]
+    cookie = test_client.get_cookie(name)
+    cookies = {name: cookie.value} if cookie else {}
+    results = {}
+    try:
+        for route, factory in factories.items():
+            rng = random.Random(seed)  # noqa: S311
+            requests = [factory(rng) for _ in range(n)]
+            latencies = []
+            lock = threading.Lock()
+
+            def send(chunk: list[Request], latencies: list[float] = latencies) -> None:
+                with httpx.Client(base_url=base_url, cookies=cookies) as client:
+                    for method, path, data in chunk:
+                        t = time.perf_counter()
+                        response = client.request(method, path, data=data)
+                        elapsed = time.perf_counter() - t
+                        if response.status_code >= 400:
+                            raise RuntimeError(
+                                f"{method} {path}: {response.status_code}"
+                            )
+                        with lock:
+                            latencies.append(elapsed)
+
+            chunks = [requests[i::concurrency] for i in range(concurrency)]
+            started = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+                list(pool.map(send, chunks))
+            results[route] = _summary(latencies, time.perf_counter() - started)
+    finally:
+        server.task_dispatcher.shutdown()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=jour.app.THREADS)
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE)
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the baseline"
+    )
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / "jour.db"
+        count = generate(path, args.years, args.seed)
+        print(f"Generated {count} entries over {args.years} years")
+        jour.app.pool = jour.db.Pool(str(path), args.threads)
+        db = jour.app.pool.get()
+        jour.app.app.secret_key = jour.models.settings.Settings(db).secret_key
+        jour.app.pool.put(db)
+
+        client = jour.app.app.test_client()
+        with client.session_transaction() as session:
+            session["email"] = EMAIL
+
+        def next_page(q: str) -> str | None:
+            response = client.post("/search", data={"q": q}, buffered=True)
+            match = NEXT_PAGE.search(response.text)
+            return html.unescape(match.group(1)) if match else None
+
+        factories = _requests(args.years, next_page)
+        results = {
+            "client": run_client(factories, args.requests, args.seed),
+            "waitress": run_waitress(
+                factories, args.requests, args.seed, args.concurrency, args.threads
+            ),
+        }
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    _compare(results, baseline.get("results", {}))
+    if args.save:
+        baseline = {
+            "settings": {
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "seed": args.seed,
+                "threads": args.threads,
+                "years": args.years,
+            },
+            "results": results,
+        }
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
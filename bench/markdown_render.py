@@ -0,0 +1,67 @@
+"""Compare markdown rendering with and without the lxml round trip.
+
+Run from the repository root:
+
+    uv run python -m bench.markdown_render
+"""
+
+import random
+import timeit
+
+import lxml.html
+import markdown
+
+import jour.components
+
+SIZES = {"1 KB": 1024, "50 KB": 50 * 1024, "1 MB": 1024 * 1024}
+WORDS = (
+    "the morning was cold and we walked to the lake before breakfast & talked "
+    "about nothing in particular while the dog ran ahead"
+).split()
+
+
+def make_entry(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)  # noqa: S311
+    paragraphs = []
+    length = 0
+    while length < size:
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 80)))
+        prefix = rng.choice(["", "", "", "> ", "* ", "## "])
+        if rng.random() < 0.1:
+            text = f"**{text}** _done_"
+        paragraphs.append(f"{prefix}{text}")
+        length += len(prefix) + len(text) + 2
+    return "\n\n".join(paragraphs)[:size]
+
+
+def render_lxml(t: str) -> str:
+    """The renderer as it was before the blockquote treeprocessor."""
+    md = markdown.Markdown()
+    doc = lxml.html.fragment_fromstring(md.convert(t), create_parent="div")
+    for el in doc.xpath("//blockquote"):
+        el.classes.update(("border-3", "border-start", "ps-2"))
+    return lxml.html.tostring(doc, encoding="unicode")
+
+
+def render_single_pass(t: str) -> str:
+    jour.components._md_cache = jour.components._RenderCache(0)
+    return str(jour.components._md(t))
+
+
+def main() -> None:
+    print(f"{'size':>6} {'lxml ms':>10} {'single ms':>10} {'speedup':>8} same")
+    for label, size in SIZES.items():
+        entry = make_entry(size)
+        number = max(1, 200_000 // size)
+        old = min(timeit.repeat(lambda: render_lxml(entry), number=number, repeat=5))
+        new = min(
+            timeit.repeat(lambda: render_single_pass(entry), number=number, repeat=5)
+        )
+        same = render_lxml(entry) == render_single_pass(entry)
+        old_ms = 1000 * old / number
+        new_ms = 1000 * new / number
+        print(f"{label:>6} {old_ms:10.2f} {new_ms:10.2f} {old / new:7.2f}x {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,23 @@
 import argparse
+import pathlib
+import sys
 from collections.abc import Callable
 
 import jour.app
+import jour.assets
 import jour.models
+import jour.transfer
 
 
 class Args:
+    batch_size: int
+    format: str
     func: Callable
     key: str
+    limit: int
+    path: pathlib.Path
+    reset: bool
+    restart: bool
     value: str
 
 
@@ -16,6 +26,25 @@ def parse_args() -> Args:
     sp = parser.add_subparsers()
     sp.required = True
 
+    ps_assets = sp.add_parser("assets")
+    ps_assets.set_defaults(func=cli_assets)
+
+    ps_export = sp.add_parser("export")
+    ps_export.add_argument("format", choices=jour.transfer.FORMATS)
+    ps_export.add_argument("path", type=pathlib.Path)
+    ps_export.set_defaults(func=cli_export)
+
+    ps_import = sp.add_parser("import")
+    ps_import.add_argument("format", choices=jour.transfer.FORMATS)
+    ps_import.add_argument("path", type=pathlib.Path)
+    ps_import.add_argument("--batch-size", type=int, default=jour.transfer.BATCH_SIZE)
+    ps_import.add_argument(
+        "--restart",
+        action="store_true",
+        help="ignore the progress saved by an interrupted import",
+    )
+    ps_import.set_defaults(func=cli_import)
+
     ps_init = sp.add_parser("init")
     ps_init.set_defaults(func=cli_init)
 
@@ -27,9 +56,40 @@ def parse_args() -> Args:
     ps_show = sp.add_parser("show")
     ps_show.set_defaults(func=cli_show)
 
+    ps_top = sp.add_parser(
+        "top-statements",
+        help="statements that took the most time, saved every minute by the app",
+    )
+    ps_top.add_argument("--limit", type=int, default=20)
+    ps_top.add_argument(
+        "--reset", action="store_true", help="clear the totals after printing them"
+    )
+    ps_top.set_defaults(func=cli_top_statements)
+
     return parser.parse_args(namespace=Args())
 
 
+def cli_assets(args: Args) -> None:
+    for name, hashed in jour.assets.build().items():
+        print(f"{name}: {hashed}")
+
+
+def cli_export(args: Args) -> None:
+    db = jour.app._get_db()
+    for count in jour.transfer.export_entries(db, args.format, args.path):
+        print(f"Exported {count} entries", file=sys.stderr)
+
+
+def cli_import(args: Args) -> None:
+    db = jour.app._get_db()
+    jour.models.init(db)
+    entries = jour.transfer.import_entries(
+        db, args.format, args.path, args.batch_size, args.restart
+    )
+    for count in entries:
+        print(f"Imported {count} entries", file=sys.stderr)
+
+
 def cli_init(args: Args) -> None:
     db = jour.app._get_db()
     jour.models.init(db)
@@ -39,7 +99,10 @@ def cli_set(args: Args) -> None:
     db = jour.app._get_db()
     settings = jour.models.settings.Settings(db)
     set_message = f"Setting {args.key} to {args.value}"
-    if args.key == "openid_client_id":
+    if args.key == "metrics_token":
+        print(set_message)
+        settings.metrics_token = args.value
+    elif args.key == "openid_client_id":
         print(set_message)
         settings.openid_client_id = args.value
     elif args.key == "openid_client_secret":
@@ -58,12 +121,27 @@ def cli_set(args: Args) -> None:
 def cli_show(args: Args) -> None:
     db = jour.app._get_db()
     settings = jour.models.settings.Settings(db)
+    print("metrics_token:", settings.metrics_token)
     print("openid_client_id:", settings.openid_client_id)
     print("openid_client_secret:", settings.openid_client_secret)
     print("openid_discovery_document:", settings.openid_discovery_document)
     print("scheme:", settings.scheme)
 
 
+def cli_top_statements(args: Args) -> None:
+    db = jour.app._get_db()
+    jour.models.init(db)
+    print(f"{'calls':>8} {'total ms':>10} {'mean ms':>8} {'max ms':>8} {'rows':>9}")
+    for s in jour.models.query_stats.list_top(db, args.limit):
+        mean = s["total_ms"] / s["calls"]
+        print(
+            f"{s['calls']:>8} {s['total_ms']:>10.1f} {mean:>8.2f} "
+            f"{s['max_ms']:>8.1f} {s['row_count']:>9}  {s['statement']}"
+        )
+    if args.reset:
+        jour.models.query_stats.delete_all(db)
+
+
 def main() -> None:
     args = parse_args()
     args.func(args)
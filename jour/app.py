@@ -1,43 +1,245 @@
 import calendar
+import collections.abc
 import datetime
 import functools
+import hashlib
+import hmac
+import json
+import math
 import pathlib
+import threading
+import time
 import typing
 import urllib.parse
 import uuid
 
 import flask
-import fort
+import flask.typing
 import httpx
 import jwt
-import waitress
 import werkzeug
 
+import jour.assets
 import jour.components
+import jour.compress
+import jour.db
+import jour.metrics
 import jour.models
+import jour.openid
+import jour.server
+import jour.versions
 
-app = flask.Flask(__name__)
+app = flask.Flask(__name__, static_folder=None)
+# Flask documents wrapping wsgi_app this way, which type checkers see as
+# replacing a method
+app.wsgi_app = jour.compress.CompressionMiddleware(app.wsgi_app)  # ty: ignore[invalid-assignment]
+pool: jour.db.Pool | None = None
+# Set to merge concurrent saves into one transaction
+writer: jour.db.GroupCommit | None = None
 
+# Seconds between looks for drafts that have not been autosaved in a while
+DRAFT_SWEEP_INTERVAL = 60
+# Seconds between saves of this process's statement stats to query_stats
+QUERY_STATS_INTERVAL = 60
+# waitress threads per process, each with its own database connection
+THREADS = 8
 
-def _build_month(date: datetime.date) -> str:
+# The search in progress for each user, so a newer search can cancel it
+_searches: dict[str, threading.Event] = {}
+_searches_lock = threading.Lock()
+
+
+def _build_id() -> str:
+    """Identify this version of the app, so ETags change when the pages do."""
+    h = hashlib.blake2b(digest_size=8)
+    for p in sorted(pathlib.Path(__file__).parent.rglob("*.py")):
+        h.update(p.read_bytes())
+    h.update(f"{jour.versions.bs} {jour.versions.bi} {jour.versions.hx}".encode())
+    return h.hexdigest()
+
+
+BUILD_ID = _build_id()
+
+
+def _build_month(date: datetime.date) -> flask.Response:
     start = date.replace(day=1)
+    with jour.metrics.phase("db"):
+        stamp = jour.models.journals.get_stamp(flask.g.db, start, month=True)
+    # Month pages also change at midnight, when another day becomes a link
+    etag = _etag(
+        stamp, "month", start, datetime.date.today(), jour.components.is_partial()
+    )
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
     end = date.replace(day=calendar.monthrange(date.year, date.month)[1])
-    dwj = jour.models.journals.list_dates_between(flask.g.db, start, end)
-    return jour.components.month(date, dwj)
+    with jour.metrics.phase("db"):
+        dwj = jour.models.journals.list_dates_between(flask.g.db, start, end)
+    return _conditional(jour.components.month(date, dwj), etag, stamp)
+
+
+def _conditional(
+    body: collections.abc.Iterable[str], etag: str, stamp: dict
+) -> flask.Response:
+    response = flask.make_response(body)
+    response.set_etag(etag)
+    response.vary.add("HX-Target")
+    if stamp:
+        response.last_modified = datetime.datetime.fromisoformat(stamp["modified_at"])
+    # Browsers may keep the page but must check that it is still current
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _cursor_arg() -> jour.models.journals.SearchCursor | None:
+    """Return the cursor for the next page of search results, if there is one."""
+    if "after_rank" not in flask.request.values:
+        return None
+    try:
+        rank = float(flask.request.values["after_rank"])
+    except ValueError:
+        flask.abort(400)
+    if not math.isfinite(rank):
+        flask.abort(400)
+    return jour.models.journals.SearchCursor(
+        rank, flask.request.values.get("after_id", "")
+    )
 
 
-def _get_db() -> fort.SQLiteDatabase:
-    db_path = pathlib.Path(".local/jour.db").resolve()
-    return fort.SQLiteDatabase(str(db_path))
+def _date_arg(name: str) -> datetime.date | None:
+    value = flask.request.values.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        flask.abort(400)
+
+
+def _delete_entry(db: jour.db.Database, date: datetime.date) -> None:
+    db.u("savepoint delete_entry")
+    try:
+        jour.models.journals.delete(db, date)
+        jour.models.drafts.delete(db, date)
+        db.u("release delete_entry")
+    except BaseException:
+        db.u("rollback to delete_entry")
+        db.u("release delete_entry")
+        raise
+
+
+def _etag(stamp: dict, *parts: object) -> str:
+    key = " ".join(
+        str(p)
+        for p in (BUILD_ID, stamp.get("modified_at"), stamp.get("version"), *parts)
+    )
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def _get_db(slow_query_ms: float = jour.db.SLOW_QUERY_MS) -> jour.db.Database:
+    return jour.db.Database(_get_db_path(), slow_query_ms)
+
+
+def _get_db_path() -> str:
+    return str(pathlib.Path(".local/jour.db").resolve())
+
+
+def _get_pool() -> jour.db.Pool:
+    global pool
+    if pool is None:
+        pool = jour.db.Pool(_get_db_path())
+    return pool
+
+
+def _migrate() -> None:
+    db = _get_db()
+    try:
+        jour.models.init(db)
+        # Made before any worker is forked, so every worker reads the same key
+        # instead of each making its own
+        app.secret_key = jour.models.settings.Settings(db).secret_key
+    finally:
+        db.close()
+
+
+def _not_modified(etag: str) -> flask.Response | None:
+    """Return a 304 response if the client already has this version of a page."""
+    if flask.request.if_none_match.contains(etag):
+        response = flask.Response(status=304)
+        response.set_etag(etag)
+        response.vary.add("HX-Target")
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    return None
+
+
+def _promote_idle_drafts() -> None:
+    """Save drafts as entries once they have not been autosaved for a while."""
+    while True:
+        time.sleep(DRAFT_SWEEP_INTERVAL)
+        db = _get_pool().get()
+        try:
+            for date in jour.models.drafts.list_idle(db):
+                app.logger.info(f"Saving idle draft for {date}")
+                _write(db, jour.models.drafts.promote, date)
+        except Exception:
+            app.logger.exception("Could not save idle drafts")
+        finally:
+            _get_pool().put(db)
+
+
+def _save_entry(db: jour.db.Database, params: dict) -> None:
+    db.u("savepoint save_entry")
+    try:
+        jour.models.journals.upsert(db, params)
+        jour.models.drafts.delete(db, params["journal_date"])
+        db.u("release save_entry")
+    except BaseException:
+        db.u("rollback to save_entry")
+        db.u("release save_entry")
+        raise
+
+
+def _save_query_stats() -> None:
+    """Add the statement stats of this process to query_stats now and then."""
+    while True:
+        time.sleep(QUERY_STATS_INTERVAL)
+        stats = jour.db.take_query_stats()
+        if not stats:
+            continue
+        db = _get_pool().get()
+        try:
+            jour.models.query_stats.add(db, stats)
+        except Exception:
+            app.logger.exception("Could not save query stats")
+        finally:
+            _get_pool().put(db)
+
+
+def _write(db: jour.db.Database, f: typing.Callable, *args: object) -> None:
+    """Call f(db, *args), or hand it to the group commit writer if there is one."""
+    if writer is None:
+        f(db, *args)
+    else:
+        writer.submit(f, *args).result()
 
 
 def login_required(f: typing.Callable) -> typing.Callable:
     @functools.wraps(f)
-    def decorated_function(*args, **kwargs) -> str | werkzeug.Response:  # noqa: ANN002, ANN003
+    def decorated_function(*args, **kwargs) -> flask.typing.ResponseReturnValue:  # noqa: ANN002, ANN003
         app.logger.debug(f"Logged in user: {flask.g.email}")
         if flask.g.email is None:
+            if "HX-Request" in flask.request.headers:
+                # Sign-in leaves the site, which htmx can not follow
+                response = flask.make_response("", 204)
+                response.headers["HX-Redirect"] = flask.url_for("sign_in")
+                return response
             return flask.redirect(flask.url_for("sign_in"))
-        if flask.g.email == flask.g.settings.user_email:
+        with jour.metrics.phase("settings"):
+            user_email = flask.g.settings.user_email
+        if flask.g.email == user_email:
             return f(*args, **kwargs)
         return jour.components.not_authorized()
 
@@ -46,15 +248,31 @@ def login_required(f: typing.Callable) -> typing.Callable:
 
 @app.before_request
 def before_request() -> None:
+    jour.metrics.start()
     app.logger.debug(f"{flask.request.method} {flask.request.path}")
     if flask.request.method == "POST":
         for k, v in flask.request.values.lists():
             app.logger.debug(f"{k}: {v}")
 
-    flask.session.permanent = True
-    flask.g.db = _get_db()
-    flask.g.settings = jour.models.settings.Settings(flask.g.db)
-    flask.g.email = flask.session.get("email")
+    if flask.request.endpoint in ("favicon", "static"):
+        return
+    with jour.metrics.phase("setup"):
+        flask.session.permanent = True
+        flask.g.db = _get_pool().get()
+        flask.g.settings = jour.models.settings.Settings(flask.g.db)
+        flask.g.email = flask.session.get("email")
+
+
+@app.after_request
+def after_request(response: flask.Response) -> flask.Response:
+    return jour.metrics.finish(response)
+
+
+@app.teardown_request
+def teardown_request(_exc: BaseException | None) -> None:
+    db = flask.g.pop("db", None)
+    if db is not None:
+        _get_pool().put(db)
 
 
 @app.get("/")
@@ -66,39 +284,64 @@ def index() -> werkzeug.Response:
 
 @app.get("/<year>/<month_>")
 @login_required
-def month(year: str, month_: str) -> str:
+def month(year: str, month_: str) -> flask.Response:
     date = datetime.date(int(year), int(month_), 1)
     return _build_month(date)
 
 
 @app.get("/<year>/<month_>/<day_>")
 @login_required
-def day(year: str, month_: str, day_: str, edit: bool = False) -> str:
+def day(year: str, month_: str, day_: str, edit: bool = False) -> flask.Response:
     date = datetime.date(int(year), int(month_), int(day_))
-    j = jour.models.journals.get_for_date(flask.g.db, date)
+    with jour.metrics.phase("db"):
+        stamp = jour.models.journals.get_stamp(flask.g.db, date)
+        draft = jour.models.drafts.get_for_date(flask.g.db, date) if edit else {}
+    etag = _etag(
+        stamp,
+        "day_edit" if edit else "day",
+        date,
+        draft.get("saved_at"),
+        jour.components.is_partial(),
+    )
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+    with jour.metrics.phase("db"):
+        j = jour.models.journals.get_for_date(flask.g.db, date)
     if j:
         entry_text = j["journal_data"]
     else:
         entry_text = ""
     if edit:
-        return jour.components.day_edit(date, entry_text)
+        if draft:
+            entry_text = draft["draft_data"]
+        body = jour.components.day_edit(date, entry_text, draft.get("saved_at"))
+        return _conditional(body, etag, stamp)
     else:
-        return jour.components.day(date, entry_text)
+        return _conditional(jour.components.day(date, entry_text), etag, stamp)
 
 
 @app.post("/<year>/<month_>/<day_>/delete")
 @login_required
 def day_delete(year: str, month_: str, day_: str) -> werkzeug.Response:
     d = datetime.date(int(year), int(month_), int(day_))
-    existing = jour.models.journals.get_for_date(flask.g.db, d)
-    if existing:
-        jour.models.journals.delete(flask.g.db, d)
+    _write(flask.g.db, _delete_entry, d)
     return flask.redirect(jour.components.build_url("month", d))
 
 
+@app.post("/<year>/<month_>/<day_>/draft")
+@login_required
+def day_draft(year: str, month_: str, day_: str) -> str:
+    d = datetime.date(int(year), int(month_), int(day_))
+    text = flask.request.values.get("entry-text", "")
+    _write(flask.g.db, jour.models.drafts.save, d, text)
+    draft = jour.models.drafts.get_for_date(flask.g.db, d)
+    return jour.components.draft_status(draft.get("saved_at"))
+
+
 @app.get("/<year>/<month_>/<day_>/edit")
 @login_required
-def day_edit(year: str, month_: str, day_: str) -> str:
+def day_edit(year: str, month_: str, day_: str) -> flask.Response:
     return day(year, month_, day_, edit=True)
 
 
@@ -106,53 +349,26 @@ def day_edit(year: str, month_: str, day_: str) -> str:
 @login_required
 def day_update(year: str, month_: str, day_: str) -> werkzeug.Response:
     d = datetime.date(int(year), int(month_), int(day_))
-    description = flask.request.values.get("entry-text")
-    existing = jour.models.journals.get_for_date(flask.g.db, d)
-    if existing:
-        params = {
-            "journal_id": existing["journal_id"],
-            "journal_date": d,
-            "journal_data": description,
-        }
-    else:
-        params = {
-            "journal_id": uuid.uuid4(),
-            "journal_date": d,
-            "journal_data": description,
-        }
-    jour.models.journals.upsert(flask.g.db, params)
+    params = {
+        "journal_id": uuid.uuid4(),
+        "journal_date": d,
+        "journal_data": flask.request.values.get("entry-text", ""),
+    }
+    _write(flask.g.db, _save_entry, params)
     return flask.redirect(jour.components.build_url("day", d))
 
 
 @app.get("/authorize")
 def authorize() -> werkzeug.Response:
-    if flask.session.get("state") != flask.request.values.get("state"):
-        return flask.Response("State mismatch", 401)
-    discovery_document = httpx.get(flask.g.settings.openid_discovery_document).json()
-    token_endpoint = discovery_document.get("token_endpoint")
-    data = {
-        "code": flask.request.values.get("code"),
-        "client_id": flask.g.settings.openid_client_id,
-        "client_secret": flask.g.settings.openid_client_secret,
-        "redirect_uri": flask.url_for(
-            "authorize", _external=True, _scheme=flask.g.settings.scheme
-        ),
-        "grant_type": "authorization_code",
-    }
-    app.logger.debug(f"{data=}")
-    response = httpx.post(token_endpoint, data=data)
-    app.logger.debug(f"{response.content=}")
-    response.raise_for_status()
-    response_data = response.json()
-    app.logger.debug(f"{response_data=}")
-    id_token = response_data.get("id_token")
-    app.logger.debug(f"{id_token=}")
-    algorithms = discovery_document.get("id_token_signing_alg_values_supported")
-    claim = jwt.decode(
-        id_token, options={"verify_signature": False}, algorithms=algorithms
+    request = token_request()
+    if isinstance(request, werkzeug.Response):
+        return request
+    discovery_document = jour.openid.provider.discovery_document(
+        flask.g.settings.openid_discovery_document
     )
-    flask.session["email"] = claim.get("email")
-    return flask.redirect(flask.url_for("index"))
+    token_endpoint = discovery_document["token_endpoint"]
+    response = jour.openid.provider.client.post(token_endpoint, data=request)
+    return sign_in_with_token(response)
 
 
 @app.post("/go")
@@ -161,13 +377,34 @@ def go() -> werkzeug.Response:
     month_ = flask.request.values["month"]
     d = datetime.date(int(year), int(month_), 1)
     response = flask.make_response()
-    response.headers["HX-Location"] = jour.components.build_url("month", d)
+    response.headers["HX-Location"] = json.dumps(
+        {"path": jour.components.build_url("month", d), "target": "#content"}
+    )
     return response
 
 
 @app.get("/favicon.svg")
 def favicon() -> flask.Response:
-    return flask.Response(jour.components.favicon(), mimetype="image/svg+xml")
+    response = flask.Response(jour.components.favicon(), mimetype="image/svg+xml")
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 60 * 60
+    response.cache_control.immutable = True
+    return response
+
+
+@app.get("/metrics")
+def metrics() -> flask.Response:
+    token = flask.g.settings.metrics_token
+    if not token:
+        flask.abort(404)
+    expected = f"Bearer {token}".encode()
+    if not hmac.compare_digest(
+        flask.request.headers.get("Authorization", "").encode(), expected
+    ):
+        return flask.Response("Unauthorized", 401, {"WWW-Authenticate": "Bearer"})
+    return flask.Response(
+        jour.metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 # @app.route("/knock", methods=["GET", "POST"])
@@ -181,14 +418,43 @@ def favicon() -> flask.Response:
 #     return flask.redirect(flask.url_for("knock"))
 
 
+@app.get("/static/<path:filename>")
+def static(filename: str) -> flask.Response:
+    return jour.assets.send(filename)
+
+
 @app.post("/search")
 @login_required
-def search() -> str:
+def search() -> collections.abc.Iterator[str] | str | flask.Response:
     q = flask.request.values.get("q")
     if q:
-        page = int(flask.request.values.get("page", 1))
-        results = jour.models.journals.search(flask.g.db, q, page)
-        return jour.components.search(results, page)
+        start = _date_arg("start")
+        end = _date_arg("end")
+        after = _cursor_arg()
+        cancel = threading.Event()
+        with _searches_lock:
+            previous = _searches.get(flask.g.email)
+            if previous is not None:
+                previous.set()
+            _searches[flask.g.email] = cancel
+        try:
+            with jour.metrics.phase("fts"):
+                months = None
+                if after is None:
+                    months = jour.models.journals.count_by_month(
+                        flask.g.db, q, start, end, cancel
+                    )
+                results = jour.models.journals.search(
+                    flask.g.db, q, after, cancel, start, end
+                )
+        except jour.models.journals.SearchCancelled:
+            app.logger.debug(f"Search for {q!r} was replaced by a newer search")
+            return flask.Response(status=204)
+        finally:
+            with _searches_lock:
+                if _searches.get(flask.g.email) is cancel:
+                    del _searches[flask.g.email]
+        return jour.components.search(results, months, start, end)
     return ""
 
 
@@ -206,15 +472,105 @@ def sign_in() -> werkzeug.Response:
         "redirect_uri": redirect_uri,
         "state": state,
     }
-    discovery_document = httpx.get(flask.g.settings.openid_discovery_document).json()
+    discovery_document = jour.openid.provider.discovery_document(
+        flask.g.settings.openid_discovery_document
+    )
     auth_endpoint = discovery_document.get("authorization_endpoint")
     auth_url = f"{auth_endpoint}?{urllib.parse.urlencode(query)}"
     app.logger.debug(f"Redirecting to {auth_url=}")
     return flask.redirect(auth_url, 307)
 
 
-def main() -> None:
-    db = _get_db()
-    jour.models.init(db)
-    app.secret_key = jour.models.settings.Settings(db).secret_key
-    waitress.serve(app)
+def setup(
+    pool_size: int = THREADS,
+    group_commit: bool = False,
+    slow_query_ms: float = jour.db.SLOW_QUERY_MS,
+) -> None:
+    """Migrate the database, then get this process ready to serve."""
+    _migrate()
+    start(pool_size, group_commit, slow_query_ms)
+
+
+def sign_in_with_token(response: httpx.Response) -> werkzeug.Response:
+    """Sign in with the ID token in the provider's answer to a token request."""
+    app.logger.debug(f"{response.content=}")
+    response.raise_for_status()
+    response_data = response.json()
+    app.logger.debug(f"{response_data=}")
+    id_token = response_data.get("id_token")
+    app.logger.debug(f"{id_token=}")
+    try:
+        claim = jour.openid.provider.decode_id_token(
+            flask.g.settings.openid_discovery_document,
+            id_token,
+            audience=flask.g.settings.openid_client_id,
+        )
+    except jwt.PyJWTError as e:
+        app.logger.warning(f"Could not verify ID token: {e}")
+        return flask.Response("Invalid ID token", 401)
+    flask.session["email"] = claim.get("email")
+    return flask.redirect(flask.url_for("index"))
+
+
+def start(
+    pool_size: int = THREADS,
+    group_commit: bool = False,
+    slow_query_ms: float = jour.db.SLOW_QUERY_MS,
+) -> None:
+    """Open the database pool and load what every request needs.
+
+    Each worker process calls this after it is forked, so no connection is
+    shared between processes."""
+    global pool, writer
+    pool = jour.db.Pool(_get_db_path(), pool_size, slow_query_ms=slow_query_ms)
+    if group_commit:
+        writer = jour.db.GroupCommit(_get_db(slow_query_ms))
+    threading.Thread(target=_promote_idle_drafts, daemon=True).start()
+    threading.Thread(target=_save_query_stats, daemon=True).start()
+    db = pool.get()
+    try:
+        settings = jour.models.settings.Settings(db)
+        app.secret_key = settings.secret_key
+        if settings.openid_discovery_document:
+            jour.openid.provider.warm(settings.openid_discovery_document)
+    finally:
+        pool.put(db)
+
+
+def token_request() -> dict | werkzeug.Response:
+    """Check the state of a sign-in and return the form for the token request."""
+    if flask.session.get("state") != flask.request.values.get("state"):
+        return flask.Response("State mismatch", 401)
+    data = {
+        "code": flask.request.values.get("code"),
+        "client_id": flask.g.settings.openid_client_id,
+        "client_secret": flask.g.settings.openid_client_secret,
+        "redirect_uri": flask.url_for(
+            "authorize", _external=True, _scheme=flask.g.settings.scheme
+        ),
+        "grant_type": "authorization_code",
+    }
+    app.logger.debug(f"{data=}")
+    return data
+
+
+def main(
+    workers: int = 1,
+    group_commit: bool = False,
+    slow_query_ms: float = jour.db.SLOW_QUERY_MS,
+    **kw: typing.Any,  # noqa: ANN401
+) -> None:
+    """Serve the app on waitress, from more than one process if workers > 1.
+
+    kw are waitress options. The database is migrated once, before any worker
+    starts."""
+    kw.setdefault("threads", THREADS)
+    if workers > 1:
+        _migrate()
+        after_fork = functools.partial(
+            start, kw["threads"], group_commit, slow_query_ms
+        )
+        jour.server.serve_workers(app, workers, after_fork, **kw)
+    else:
+        setup(kw["threads"], group_commit, slow_query_ms)
+        jour.server.serve(app, **kw)
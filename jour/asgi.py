@@ -0,0 +1,290 @@
+"""Serve the app from an ASGI server.
+
+Views stay synchronous and run on a bounded pool of threads, no larger than
+the database pool, so a burst of requests queues here instead of holding
+threads that wait for a connection. Request and response bodies move on the
+event loop, so a slow client does not hold a thread while it reads or writes.
+The round trips to the OpenID provider during sign-in are awaited on the event
+loop too.
+
+uvicorn is not a dependency. Run it with:
+
+    uv run --with uvicorn run.py --asgi
+"""
+
+import asyncio
+import collections.abc
+import concurrent.futures
+import contextvars
+import io
+import logging
+import sys
+import typing
+
+import flask
+import werkzeug
+
+import jour.app
+import jour.db
+import jour.models
+import jour.openid
+
+log = logging.getLogger(__name__)
+
+if typing.TYPE_CHECKING:
+    from _typeshed import OptExcInfo
+    from _typeshed.wsgi import WSGIApplication, WSGIEnvironment
+
+    Receive = collections.abc.Callable[[], collections.abc.Awaitable[dict]]
+    Send = collections.abc.Callable[[dict], collections.abc.Awaitable[None]]
+
+
+def _configured_discovery_url() -> str:
+    """Read the discovery document URL from settings, outside of any request."""
+    pool = jour.app._get_pool()
+    db = pool.get()
+    try:
+        return jour.models.settings.Settings(db).openid_discovery_document
+    finally:
+        pool.put(db)
+
+
+def _discovery_url() -> str:
+    return flask.g.settings.openid_discovery_document
+
+
+def _environ(scope: dict, body: bytes) -> WSGIEnvironment:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key not in ("CONTENT_LENGTH", "CONTENT_TYPE"):
+            key = f"HTTP_{key}"
+        if key in environ and key != "CONTENT_LENGTH":
+            # Cookie pairs are separated by semicolons, other lists by commas
+            sep = "; " if key == "HTTP_COOKIE" else ","
+            environ[key] = f"{environ[key]}{sep}{value.decode('latin-1')}"
+        else:
+            environ[key] = value.decode("latin-1")
+    return environ
+
+
+def _headers(headers: collections.abc.Iterable[tuple[str, str]]) -> list:
+    return [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in headers
+    ]
+
+
+def _in_request(
+    environ: WSGIEnvironment, f: collections.abc.Callable[[], typing.Any]
+) -> typing.Any:  # noqa: ANN401
+    """Call f as a view would be called, with the app's request handlers.
+
+    A response from f is finalized, which saves the session; anything else is
+    returned as it is."""
+    app = jour.app.app
+    with app.request_context(environ):
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = f()
+        except Exception as e:
+            try:
+                rv = app.handle_user_exception(e)
+            except Exception as e:
+                return app.handle_exception(e)
+        if isinstance(rv, werkzeug.Response):
+            return app.finalize_request(rv)
+        return rv
+
+
+async def _read_body(receive: Receive) -> bytes:
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body.extend(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return bytes(body)
+
+
+def _token_request() -> tuple[str, dict] | werkzeug.Response:
+    request = jour.app.token_request()
+    if isinstance(request, werkzeug.Response):
+        return request
+    return _discovery_url(), request
+
+
+class Application:
+    """An ASGI app that runs a WSGI app on a bounded pool of threads.
+
+    Some requests get a handler of their own, which can await the network
+    before or instead of calling the WSGI app."""
+
+    def __init__(
+        self, wsgi_app: WSGIApplication, max_workers: int = jour.app.THREADS
+    ) -> None:
+        self.wsgi_app = wsgi_app
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="jour"
+        )
+        self.handlers = {
+            ("GET", "/authorize"): self._authorize,
+            ("GET", "/sign-in"): self._sign_in,
+        }
+
+    async def __call__(self, scope: dict, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        environ = _environ(scope, await _read_body(receive))
+        handler = self.handlers.get((scope["method"], scope["path"]))
+        if handler is not None:
+            response = await handler(environ)
+            if response is not None:
+                await self._respond(response, send)
+                return
+        await self._dispatch(environ, send)
+
+    async def _authorize(self, environ: WSGIEnvironment) -> werkzeug.Response:
+        request = await self.run(_in_request, environ, _token_request)
+        if isinstance(request, werkzeug.Response):
+            return request
+        discovery_url, data = request
+        provider = jour.openid.provider
+        discovery_document = await provider.aget_json(discovery_url)
+        # Have the keys at hand, so verifying the token does not fetch them
+        await provider.aget_json(discovery_document["jwks_uri"])
+        token_endpoint = discovery_document["token_endpoint"]
+        response = await provider.async_client.post(token_endpoint, data=data)
+        return await self.run(
+            _in_request, environ, lambda: jour.app.sign_in_with_token(response)
+        )
+
+    async def _dispatch(self, environ: WSGIEnvironment, send: Send) -> None:
+        started = []
+        written = []
+
+        def start_response(
+            status: str,
+            headers: list[tuple[str, str]],
+            exc_info: OptExcInfo | None = None,
+        ) -> collections.abc.Callable[[bytes], object]:
+            started[:] = [status, headers]
+            return written.append
+
+        def begin() -> tuple:
+            body = self.wsgi_app(environ, start_response)
+            chunks = iter(body)
+            return body, chunks, next(chunks, None)
+
+        # A streamed body pushes the request context when it starts and pops it
+        # when it ends, so every step has to run in the same context, even
+        # though it may run on a different thread
+        context = contextvars.copy_context()
+        body, chunks, chunk = await self.run(context.run, begin)
+        try:
+            status, headers = started
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": int(status.split(" ", 1)[0]),
+                    "headers": _headers(headers),
+                }
+            )
+            for data in written:
+                await send(
+                    {"type": "http.response.body", "body": data, "more_body": True}
+                )
+            while chunk is not None:
+                if chunk:
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+                chunk = await self.run(context.run, next, chunks, None)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            close = getattr(body, "close", None)
+            if close is not None:
+                await self.run(context.run, close)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await jour.openid.provider.async_client.aclose()
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _respond(self, response: werkzeug.Response, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": _headers(response.headers.to_wsgi_list()),
+            }
+        )
+        await send({"type": "http.response.body", "body": response.get_data()})
+
+    async def _sign_in(self, environ: WSGIEnvironment) -> None:
+        # The view only reads the discovery document, so fetch it here first.
+        # The view runs in the only request context for this request.
+        url = await self.run(_configured_discovery_url)
+        if url:
+            await jour.openid.provider.aget_json(url)
+
+    async def run(
+        self,
+        f: collections.abc.Callable[..., typing.Any],
+        *args: typing.Any,  # noqa: ANN401
+    ) -> typing.Any:  # noqa: ANN401
+        """Call f on the pool of threads and wait for it on the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, f, *args)
+
+
+def main(
+    host: str = "0.0.0.0",  # noqa: S104
+    port: int = 8080,
+    threads: int = jour.app.THREADS,
+    group_commit: bool = False,
+    slow_query_ms: float = jour.db.SLOW_QUERY_MS,
+) -> None:
+    try:
+        import uvicorn
+    except ModuleNotFoundError:
+        log.critical("ASGI mode needs uvicorn: uv run --with uvicorn run.py --asgi")
+        raise SystemExit(1) from None
+    # One database connection for each thread
+    jour.app.setup(threads, group_commit, slow_query_ms)
+    # Keep the logging set up by notch
+    uvicorn.run(
+        Application(jour.app.app, threads), host=host, port=port, log_config=None
+    )
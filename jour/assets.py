@@ -0,0 +1,141 @@
+import functools
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import pathlib
+import re
+
+import flask
+import httpx
+import werkzeug.security
+
+import jour.versions as v
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+try:
+    from compression import zstd
+except ModuleNotFoundError:
+    zstd = None
+
+log = logging.getLogger(__name__)
+
+CDN = "https://cdn.jsdelivr.net/npm"
+STATIC_DIR = pathlib.Path(__file__).parent / "static"
+MANIFEST = STATIC_DIR / "manifest.json"
+
+# Logical name: path on the CDN
+ASSETS = {
+    "bootstrap.min.css": f"bootstrap@{v.bs}/dist/css/bootstrap.min.css",
+    "bootstrap.bundle.min.js": f"bootstrap@{v.bs}/dist/js/bootstrap.bundle.min.js",
+    "bootstrap-icons.min.css": f"bootstrap-icons@{v.bi}/font/bootstrap-icons.min.css",
+    "htmx.js": f"htmx.org@{v.hx}/dist/htmx.js",
+}
+# Only text assets are worth compressing; fonts are compressed already
+COMPRESSIBLE = (".css", ".js", ".svg")
+# Encodings in order of preference: (Content-Encoding, file suffix)
+ENCODINGS = (("br", ".br"), ("zstd", ".zst"), ("gzip", ".gz"))
+MAX_AGE = 365 * 24 * 60 * 60
+FONT_URL = re.compile(r'url\("?(fonts/[^")?]+)(?:\?[^")]*)?"?\)')
+
+
+def _compress(path: pathlib.Path, data: bytes) -> None:
+    if path.suffix not in COMPRESSIBLE:
+        return
+    path.with_name(f"{path.name}.gz").write_bytes(gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        path.with_name(f"{path.name}.br").write_bytes(brotli.compress(data))
+    if zstd is not None:
+        path.with_name(f"{path.name}.zst").write_bytes(zstd.compress(data, 19))
+
+
+def _fetch(client: httpx.Client, path: str) -> bytes:
+    log.info(f"Downloading {CDN}/{path}")
+    response = client.get(f"{CDN}/{path}")
+    response.raise_for_status()
+    return response.content
+
+
+def _write(name: str, data: bytes) -> str:
+    """Write data under a name that includes its hash and return that name."""
+    stem, _, suffix = name.rpartition(".")
+    digest = hashlib.blake2b(data, digest_size=6).hexdigest()
+    hashed = f"{stem}.{digest}.{suffix}"
+    path = STATIC_DIR / hashed
+    path.write_bytes(data)
+    _compress(path, data)
+    return hashed
+
+
+def build() -> dict[str, str]:
+    """Vendor the front-end packages listed in package.json.
+
+    The exact versions are downloaded from the CDN into STATIC_DIR under
+    content-hashed names, with pre-compressed copies next to them, and the
+    manifest maps each logical name to its hashed name."""
+    STATIC_DIR.mkdir(parents=True, exist_ok=True)
+    result = {}
+    with httpx.Client(follow_redirects=True, timeout=30) as client:
+        for name, path in ASSETS.items():
+            data = _fetch(client, path)
+            if name == "bootstrap-icons.min.css":
+                # The font files are referenced relative to the stylesheet
+                base = path.rpartition("/")[0]
+                fonts = {}
+                for font in set(FONT_URL.findall(data.decode())):
+                    font_name = font.rpartition("/")[2]
+                    fonts[font] = _write(font_name, _fetch(client, f"{base}/{font}"))
+                    result[font_name] = fonts[font]
+                data = FONT_URL.sub(
+                    lambda m: f'url("{fonts[m.group(1)]}")', data.decode()
+                ).encode()
+            result[name] = _write(name, data)
+    MANIFEST.write_text(json.dumps(result, indent=2, sort_keys=True))
+    manifest.cache_clear()
+    return result
+
+
+@functools.cache
+def manifest() -> dict[str, str]:
+    try:
+        return json.loads(MANIFEST.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def send(filename: str) -> flask.Response:
+    """Serve a vendored file, pre-compressed if the client accepts it."""
+    accepted = flask.request.accept_encodings
+    response = None
+    for encoding, suffix in ENCODINGS:
+        path = werkzeug.security.safe_join(str(STATIC_DIR), f"{filename}{suffix}")
+        if accepted[encoding] and path and pathlib.Path(path).is_file():
+            response = flask.send_from_directory(
+                STATIC_DIR,
+                f"{filename}{suffix}",
+                max_age=MAX_AGE,
+                mimetype=mimetypes.guess_type(filename)[0],
+            )
+            response.content_encoding = encoding
+            break
+    if response is None:
+        response = flask.send_from_directory(STATIC_DIR, filename, max_age=MAX_AGE)
+    response.vary.add("Accept-Encoding")
+    response.cache_control.immutable = True
+    return response
+
+
+def url(name: str) -> str:
+    """Return the URL of an asset by its logical name.
+
+    Falls back to the CDN when assets have not been built, as in a fresh
+    checkout."""
+    hashed = manifest().get(name)
+    if hashed is None:
+        return f"{CDN}/{ASSETS[name]}"
+    return flask.url_for("static", filename=hashed)
@@ -1,30 +1,50 @@
 import calendar
+import collections
+import collections.abc
 import datetime
+import functools
+import hashlib
+import html
+import re
+import sys
+import threading
+import typing
+import xml.etree.ElementTree
 from typing import Literal
 
 import flask
 import htpy
 import lxml.html
 import markdown
+import markdown.extensions
+import markdown.postprocessors
+import markdown.treeprocessors
 import markupsafe
 
+import jour.assets
+import jour.metrics
 import jour.models as m
-import jour.versions as v
 
-CDN = "https://cdn.jsdelivr.net/npm"
-BOOTSTRAP_CSS = htpy.link(
-    href=f"{CDN}/bootstrap@{v.bs}/dist/css/bootstrap.min.css", rel="stylesheet"
-)
-BOOTSTRAP_ICONS_CSS = htpy.link(
-    href=f"{CDN}/bootstrap-icons@{v.bi}/font/bootstrap-icons.min.css", rel="stylesheet"
-)
-BOOTSTRAP_JS = htpy.script(
-    src=f"{CDN}/bootstrap@{v.bs}/dist/js/bootstrap.bundle.min.js"
-)
-HTMX_JS = htpy.script(src=f"{CDN}/htmx.org@{v.hx}/dist/htmx.js")
+# Rendered HTML is sent in blocks of about this many characters
+STREAM_CHUNK_SIZE = 16 * 1024
 
 
 def _base(content: htpy.Node) -> htpy.Node:
+    a = jour.assets
+    preload = [
+        htpy.link(as_="script", href=a.url("bootstrap.bundle.min.js"), rel="preload"),
+        htpy.link(as_="script", href=a.url("htmx.js"), rel="preload"),
+    ]
+    if "bootstrap-icons.woff2" in a.manifest():
+        preload.append(
+            htpy.link(
+                as_="font",
+                crossorigin=True,
+                href=a.url("bootstrap-icons.woff2"),
+                rel="preload",
+                type="font/woff2",
+            )
+        )
     return htpy.html(lang="en")[
         htpy.head[
             htpy.meta(charset="utf-8"),
@@ -34,34 +54,226 @@ def _base(content: htpy.Node) -> htpy.Node:
             ),
             htpy.title["Jour"],
             htpy.link(href=flask.url_for("favicon"), rel="icon"),
-            BOOTSTRAP_CSS,
-            BOOTSTRAP_ICONS_CSS,
+            preload,
+            htpy.link(href=a.url("bootstrap.min.css"), rel="stylesheet"),
+            htpy.link(href=a.url("bootstrap-icons.min.css"), rel="stylesheet"),
         ],
-        htpy.body[
+        htpy.body(hx_boost="true", hx_target="#content")[
             htpy.div(".container-fluid")[
                 htpy.div(".row")[
                     htpy.div(
-                        ".col-12.col-sm-9.col-md-7.col-lg-6.col-xl-5.col-xxl-4.mx-auto"
+                        "#content.col-12.col-sm-9.col-md-7.col-lg-6.col-xl-5.col-xxl-4.mx-auto"
                     )[content]
                 ]
             ],
-            BOOTSTRAP_JS,
-            HTMX_JS,
+            htpy.script(src=a.url("bootstrap.bundle.min.js")),
+            htpy.script(src=a.url("htmx.js")),
         ],
     ]
 
 
+def _blocks(node: htpy.Node) -> collections.abc.Iterator[str]:
+    """Render a node in blocks of about STREAM_CHUNK_SIZE characters.
+
+    The head of a page is a block of its own, so the browser can fetch
+    stylesheets while the body is rendered."""
+    block = []
+    size = 0
+    for chunk in htpy.fragment[node].iter_chunks():
+        block.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_CHUNK_SIZE or chunk == "</head>":
+            yield "".join(block)
+            block = []
+            size = 0
+    if block:
+        yield "".join(block)
+
+
+def _page(content: htpy.Node) -> collections.abc.Iterator[str]:
+    """Stream a full page, or just its content for htmx navigation."""
+    if is_partial():
+        return _stream(htpy.fragment[content])
+    return _stream(_base(content))
+
+
+class _RenderCache:
+    """Least recently used rendered HTML, bounded by total size in bytes."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: collections.OrderedDict[bytes, str] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> str | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: bytes, value: str) -> None:
+        value_size = sys.getsizeof(value)
+        if value_size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self.size += value_size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= sys.getsizeof(evicted)
+
+
+MD_CACHE_BYTES = 32 * 1024 * 1024
+_md_cache = _RenderCache(MD_CACHE_BYTES)
+_md_local = threading.local()
+
+BLOCKQUOTE_CLASSES = "border-3 border-start ps-2"
+CHAR_REF = re.compile(r"&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);")
+ESCAPED_CHARS = {"&": "&amp;", "<": "&lt;", ">": "&gt;"}
+# Attribute values that lxml writes the same way markdown does
+PLAIN_VALUE = re.compile(r"[^\"\x00-\x1f\x7f]*")
+PLAIN_URI = re.compile(r"[A-Za-z0-9\-_.!~*'()@/:=?;#%&,+]*")
+URI_ATTRIBUTES = {"action", "href", "name", "src"}
+
+
+class _BlockquoteClasses(markdown.treeprocessors.Treeprocessor):
+    def run(self, root: xml.etree.ElementTree.Element) -> None:
+        for el in root.iter("blockquote"):
+            el.set("class", BLOCKQUOTE_CLASSES)
+
+
+class _CharRefs(markdown.postprocessors.Postprocessor):
+    """Write character references as the characters they stand for.
+
+    This matches how entries were serialized when rendering went through lxml:
+    only &, < and > stay escaped, and unknown references are escaped. Output
+    that still goes through lxml is left alone."""
+
+    def __init__(self, md: markdown.Markdown, ext: _JourExtension) -> None:
+        super().__init__(md)
+        self.ext = ext
+        # Reset in place between documents, so it can be kept
+        self.html_stash = md.htmlStash
+
+    @staticmethod
+    def _replace(m: re.Match) -> str:
+        ref = m.group()
+        char = html.unescape(ref)
+        if not char:
+            # html drops some code points, like control characters, that lxml keeps
+            number = ref[2:-1]
+            char = chr(int(number[1:], 16) if number[0] in "xX" else int(number))
+        if char == ref:
+            return f"&amp;{ref[1:]}"
+        return ESCAPED_CHARS.get(char, char)
+
+    def run(self, text: str) -> str:
+        # Raw HTML is stashed before the tree is built, so it is only seen here
+        if any(str(b).lstrip().startswith("<") for b in self.html_stash.rawHtmlBlocks):
+            self.ext.use_lxml = True
+        if self.ext.use_lxml or "&" not in text:
+            return text
+        return CHAR_REF.sub(self._replace, text)
+
+
+class _JourExtension(markdown.extensions.Extension):
+    """Style blockquotes, and serialize entries the way lxml used to.
+
+    Raw HTML, empty list items and attribute values that lxml would rewrite
+    (quotes, character references, spaces and non-ASCII characters in a URL, or
+    a value that equals the attribute name) are rare, so entries that have them
+    are still rendered through lxml rather than copying every rule of its
+    serializer."""
+
+    def extendMarkdown(self, md: markdown.Markdown) -> None:
+        md.registerExtension(self)
+        self.reset()
+        md.treeprocessors.register(_BlockquoteClasses(md), "blockquote_classes", 0)
+        md.treeprocessors.register(_LxmlRewrites(md, self), "lxml_rewrites", 0)
+        md.postprocessors.register(_CharRefs(md, self), "char_refs", 0)
+
+    def reset(self) -> None:
+        self.use_lxml = False
+
+
+class _LxmlRewrites(markdown.treeprocessors.Treeprocessor):
+    """Note whether lxml would write any element differently."""
+
+    def __init__(self, md: markdown.Markdown, ext: _JourExtension) -> None:
+        super().__init__(md)
+        self.ext = ext
+
+    def run(self, root: xml.etree.ElementTree.Element) -> None:
+        for el in root.iter():
+            # lxml leaves out the end tag of an empty list item
+            if el.tag == "li" and not el.text and len(el) == 0:
+                self.ext.use_lxml = True
+                return
+            for name, value in el.items():
+                plain = PLAIN_URI if name in URI_ATTRIBUTES else PLAIN_VALUE
+                if not plain.fullmatch(value) or CHAR_REF.search(value):
+                    self.ext.use_lxml = True
+                    return
+                # markdown writes alt="alt" as a bare alt, but lxml keeps the value
+                if value == name:
+                    self.ext.use_lxml = True
+                    return
+
+
+def _markdown() -> tuple[markdown.Markdown, _JourExtension]:
+    """Return the Markdown instance for the current thread, and its extension."""
+    local = getattr(_md_local, "markdown", None)
+    if local is None:
+        ext = _JourExtension()
+        md = markdown.Markdown(extensions=[ext], output_format="html")
+        local = _md_local.markdown = md, ext
+    return local
+
+
 def _md(t: str) -> markupsafe.Markup:
-    """Take markdown-formatted text as input and render into HTML."""
+    """Take markdown-formatted text as input and render into HTML.
+
+    Rendered HTML is cached by a hash of the input, so an entry that has not
+    changed is only rendered once."""
+    key = hashlib.blake2b(t.encode(), digest_size=16).digest()
+    result = _md_cache.get(key)
+    if result is None:
+        with jour.metrics.phase("markdown"):
+            md, ext = _markdown()
+            try:
+                result = f"<div>{md.convert(t)}</div>"
+                if ext.use_lxml:
+                    result = _md_with_lxml(t)
+            finally:
+                md.reset()
+        _md_cache.put(key, result)
+    return markupsafe.Markup(result)  # noqa: S704
+
+
+def _md_with_lxml(t: str) -> str:
+    """Render the way entries were rendered before the markdown extension."""
     md = markdown.Markdown()
     doc = lxml.html.fragment_fromstring(md.convert(t), create_parent="div")
     for el in doc.xpath("//blockquote"):
-        el.classes.update(("border-3", "border-start", "ps-2"))
-    result = lxml.html.tostring(doc, encoding="unicode")
-    return markupsafe.Markup(result)  # noqa: S704
+        el.classes.update(BLOCKQUOTE_CLASSES.split())
+    return lxml.html.tostring(doc, encoding="unicode")
+
+
+def _render(node: htpy.Node) -> markupsafe.Markup:
+    """Render a node once, to be reused as a child of other nodes."""
+    return markupsafe.Markup(str(node))  # noqa: S704
 
 
-Endpoint = Literal["day", "day_delete", "day_edit", "day_update", "month"]
+def _stream(node: htpy.Node) -> collections.abc.Iterator[str]:
+    """Render a node as it is sent, with the request context still at hand."""
+    return flask.stream_with_context(jour.metrics.stream(_blocks(node)))
+
+
+Endpoint = Literal["day", "day_delete", "day_draft", "day_edit", "day_update", "month"]
 
 
 def build_url(endpoint: Endpoint, d: datetime.date) -> str:
@@ -70,13 +282,13 @@ def build_url(endpoint: Endpoint, d: datetime.date) -> str:
     day_ = d.strftime("%d")
     if endpoint == "month":
         return flask.url_for(endpoint, year=year, month_=month_)
-    elif endpoint in ["day", "day_delete", "day_edit", "day_update"]:
+    elif endpoint in ["day", "day_delete", "day_draft", "day_edit", "day_update"]:
         return flask.url_for(endpoint, year=year, month_=month_, day_=day_)
     else:
         return flask.url_for("index")
 
 
-def day(date: datetime.date, entry_text: str) -> str:
+def day(date: datetime.date, entry_text: str) -> collections.abc.Iterator[str]:
     content = [
         htpy.div(".justify-content-between.pt-3.row")[
             htpy.div(".col-auto")[
@@ -93,12 +305,15 @@ def day(date: datetime.date, entry_text: str) -> str:
                 ]
             ],
         ],
-        htpy.div(".pt-3.row")[htpy.div(".col")[_md(entry_text)]],
+        # Rendered after the head and header have been sent
+        htpy.div(".pt-3.row")[htpy.div(".col")[functools.partial(_md, entry_text)]],
     ]
-    return str(_base(content))
+    return _page(content)
 
 
-def day_edit(date: datetime.date, entry_text: str) -> str:
+def day_edit(
+    date: datetime.date, entry_text: str, draft_saved_at: str | None = None
+) -> collections.abc.Iterator[str]:
     content = [
         htpy.div(".justify-content-between.pt-3.row")[
             htpy.div(".col-auto")[
@@ -122,9 +337,16 @@ def day_edit(date: datetime.date, entry_text: str) -> str:
                         htpy.textarea(
                             ".form-control",
                             aria_label="Journal entry",
+                            hx_post=build_url("day_draft", date),
+                            hx_swap="innerHTML",
+                            hx_target="#draft-status",
+                            hx_trigger="input changed delay:1s",
                             name="entry-text",
                             rows=20,
-                        )[entry_text]
+                        )[entry_text],
+                        htpy.div("#draft-status.form-text")[
+                            draft_status(draft_saved_at)
+                        ],
                     ],
                     htpy.div(".mb-3")[
                         htpy.button(
@@ -137,7 +359,14 @@ def day_edit(date: datetime.date, entry_text: str) -> str:
             ]
         ],
     ]
-    return str(_base(content))
+    return _page(content)
+
+
+def draft_status(saved_at: str | None) -> str:
+    if saved_at is None:
+        return ""
+    saved = datetime.datetime.fromisoformat(saved_at).astimezone()
+    return _render(htpy.span[f"Draft saved at {saved:%H:%M}"])
 
 
 def favicon() -> str:
@@ -172,125 +401,181 @@ def favicon() -> str:
     return str(content)
 
 
-def knock() -> str:
+def is_partial() -> bool:
+    """Whether this request is htmx navigation that only replaces #content.
+
+    History restores also come from htmx, but need the whole page."""
+    headers = flask.request.headers
+    return (
+        headers.get("HX-Target") == "content"
+        and "HX-History-Restore-Request" not in headers
+    )
+
+
+def knock() -> collections.abc.Iterator[str]:
     content = htpy.form(method="post")[
         htpy.input(".form-control", name="pw", type="password")
     ]
-    return str(_base(content))
+    return _page(content)
 
 
-def month(date: datetime.date, dates_with_journals: list[datetime.date]) -> str:
-    start = date.replace(day=1)
+class _MonthParts(typing.NamedTuple):
+    """The parts of a month page that do not depend on which days have entries."""
+
+    header: markupsafe.Markup
+    table_head: markupsafe.Markup
+    # Each week is a list of (day, cell with an entry, cell without an entry),
+    # where day is 0 for days from the neighbouring months
+    weeks: list[list[tuple[int, markupsafe.Markup, markupsafe.Markup]]]
+    search: markupsafe.Markup
+
+
+@functools.lru_cache(maxsize=64)
+def _month_parts(
+    start: datetime.date, today: datetime.date, _script_root: str
+) -> _MonthParts:
+    """Render the static parts of a month page.
+
+    The result depends on the month, on today (future days are not links and
+    the year list ends at this year) and on where the app is mounted, which
+    url_for reads from the request."""
     prev_month = start - datetime.timedelta(days=1)
     next_month = start + datetime.timedelta(days=31)
-    today = datetime.date.today()
     cal = calendar.Calendar(firstweekday=calendar.SUNDAY)
     day_names = (calendar.day_name[i][0:2] for i in cal.iterweekdays())
-    cal_tds = {}
+    weeks = []
     for w in cal.monthdatescalendar(start.year, start.month):
+        week = []
         for d in w:
-            if d.month == start.month:
+            day_ = d.day if d.month == start.month else 0
+            if day_:
                 if d > today:
-                    cal_tds[d] = htpy.td(".text-secondary")[d.day]
-                elif d in dates_with_journals:
-                    cal_tds[d] = htpy.td(".table-success")[
+                    with_entry = without_entry = htpy.td(".text-secondary")[d.day]
+                else:
+                    with_entry = htpy.td(".table-success")[
                         htpy.a(
                             ".link-success.text-decoration-none",
                             href=build_url("day", d),
                         )[d.day]
                     ]
-                else:
-                    cal_tds[d] = htpy.td[
+                    without_entry = htpy.td[
                         htpy.a(".text-decoration-none", href=build_url("day_edit", d))[
                             d.day
                         ]
                     ]
             else:
-                cal_tds[d] = htpy.td
-    content = [
-        htpy.div(".align-items-center.justify-content-between.pt-3.row")[
-            htpy.div(".col-auto")[
-                htpy.a(
-                    ".btn.btn-outline-primary",
-                    href=build_url("month", prev_month),
-                )[htpy.i(".bi-chevron-left")]
-            ],
-            htpy.div(".col-auto")[
-                htpy.form[
-                    htpy.div(".input-group")[
-                        htpy.select(
-                            ".form-select", hx_post=flask.url_for("go"), name="month"
-                        )[
-                            (
-                                htpy.option(selected=(i == start.month), value=i)[m_]
-                                for i, m_ in enumerate(calendar.month_name[1:], start=1)
-                            )
-                        ],
-                        htpy.select(
-                            ".form-select", hx_post=flask.url_for("go"), name="year"
-                        )[
-                            (
-                                htpy.option(selected=(y == start.year))[y]
-                                for y in range(today.year, 1982, -1)
-                            )
-                        ],
-                    ]
-                ]
-            ],
-            htpy.div(".col-auto")[
-                htpy.a(
-                    ".btn.btn-outline-primary",
-                    href=build_url("month", next_month),
-                )[htpy.i(".bi-chevron-right")]
-                if start < today.replace(day=1)
-                else htpy.button(".btn.invisible", disabled=True)[
-                    markupsafe.Markup("&rarr;")
-                ]
-            ],
+                with_entry = without_entry = htpy.td
+            week.append((day_, _render(with_entry), _render(without_entry)))
+        weeks.append(week)
+    header = htpy.div(".align-items-center.justify-content-between.pt-3.row")[
+        htpy.div(".col-auto")[
+            htpy.a(
+                ".btn.btn-outline-primary",
+                href=build_url("month", prev_month),
+            )[htpy.i(".bi-chevron-left")]
         ],
-        htpy.div(".pt-3.row")[
-            htpy.div(".col")[
-                htpy.table(".fs-4.table.text-center")[
-                    htpy.thead[htpy.tr[(htpy.th[d] for d in day_names)]],
-                    htpy.tbody[
+        htpy.div(".col-auto")[
+            htpy.form[
+                htpy.div(".input-group")[
+                    htpy.select(
+                        ".form-select", hx_post=flask.url_for("go"), name="month"
+                    )[
+                        (
+                            htpy.option(selected=(i == start.month), value=i)[m_]
+                            for i, m_ in enumerate(calendar.month_name[1:], start=1)
+                        )
+                    ],
+                    htpy.select(
+                        ".form-select", hx_post=flask.url_for("go"), name="year"
+                    )[
                         (
-                            htpy.tr[(cal_tds[d] for d in w)]
-                            for w in cal.monthdatescalendar(start.year, start.month)
+                            htpy.option(selected=(y == start.year))[y]
+                            for y in range(today.year, 1982, -1)
                         )
                     ],
                 ]
             ]
         ],
+        htpy.div(".col-auto")[
+            htpy.a(
+                ".btn.btn-outline-primary",
+                href=build_url("month", next_month),
+            )[htpy.i(".bi-chevron-right")]
+            if start < today.replace(day=1)
+            else htpy.button(".btn.invisible", disabled=True)[
+                markupsafe.Markup("&rarr;")
+            ]
+        ],
+    ]
+    search = htpy.div(".pt-3.row")[
+        htpy.div(".col")[
+            htpy.form[
+                htpy.input(
+                    ".form-control",
+                    aria_label="Search",
+                    hx_post=flask.url_for("search"),
+                    hx_sync="this:replace",
+                    hx_target="#search-results",
+                    hx_trigger="search, keyup changed delay:300ms",
+                    name="q",
+                    placeholder="Search...",
+                    type="search",
+                )
+            ]
+        ]
+    ]
+    return _MonthParts(
+        header=_render(header),
+        table_head=_render(htpy.thead[htpy.tr[(htpy.th[d] for d in day_names)]]),
+        weeks=weeks,
+        search=_render(search),
+    )
+
+
+def month(
+    date: datetime.date, dates_with_journals: collections.abc.Iterable[datetime.date]
+) -> collections.abc.Iterator[str]:
+    start = date.replace(day=1)
+    parts = _month_parts(start, datetime.date.today(), flask.request.script_root)
+    journal_days = {d.day for d in dates_with_journals if d.month == start.month}
+    tbody = []
+    for week in parts.weeks:
+        tbody.append("<tr>")
+        for day_, with_entry, without_entry in week:
+            tbody.append(with_entry if day_ in journal_days else without_entry)
+        tbody.append("</tr>")
+    content = [
+        parts.header,
         htpy.div(".pt-3.row")[
             htpy.div(".col")[
-                htpy.form[
-                    htpy.input(
-                        ".form-control",
-                        aria_label="Search",
-                        hx_post=flask.url_for("search"),
-                        hx_target="#search-results",
-                        hx_trigger="search, keyup changed delay:300ms",
-                        name="q",
-                        placeholder="Search...",
-                        type="search",
-                    )
+                htpy.table(".fs-4.table.text-center")[
+                    parts.table_head,
+                    htpy.tbody[markupsafe.Markup("".join(tbody))],  # noqa: S704
                 ]
             ]
         ],
+        parts.search,
         htpy.div(".pt-3.row")[htpy.div("#search-results.col")],
     ]
-    return str(_base(content))
+    return _page(content)
 
 
-def not_authorized() -> str:
+def not_authorized() -> collections.abc.Iterator[str]:
     content = htpy.div(".pt-3.row")[htpy.div(".col")[htpy.h1["Not authorized"]]]
-    return str(_base(content))
+    return _page(content)
 
 
-def search(results: list[m.journals.SearchResult], page: int) -> str:
+def search(
+    results: list[m.journals.SearchResult],
+    months: dict[str, int] | None = None,
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+) -> collections.abc.Iterator[str]:
     content = []
+    if months:
+        content.append(_search_facets(months, start, end))
     for i, r in enumerate(results):
-        if i < 11:
+        if i < m.journals.PAGE_SIZE:
             content.append(
                 htpy.div(".card.mb-2")[
                     htpy.div(".card-body")[
@@ -318,14 +603,78 @@ def search(results: list[m.journals.SearchResult], page: int) -> str:
                 ]
             )
         else:
+            last = results[i - 1]
             content.append(
                 htpy.div(
                     hx_include="form",
-                    hx_post=flask.url_for("search", page=page + 1),
+                    hx_post=flask.url_for(
+                        "search",
+                        after_id=str(last.get("journal_id")),
+                        after_rank=repr(last.get("rank")),
+                        **_search_range(start, end),
+                    ),
                     hx_swap="outerHTML",
+                    hx_target="this",
                     hx_trigger="revealed",
                 )[htpy.span(".htmx-indicator.spinner-border.spinner-border-sm")]
             )
     if not content:
         content.append("no results")
-    return str(htpy.fragment[content])
+    return _stream(htpy.fragment[content])
+
+
+def _search_facets(
+    months: dict[str, int], start: datetime.date | None, end: datetime.date | None
+) -> htpy.Node:
+    """Count the matches, with buttons that narrow the search to a year, or to
+    a month when every match is in one year."""
+    years: dict[int, int] = {}
+    for month, hits in months.items():
+        years[int(month[:4])] = years.get(int(month[:4]), 0) + hits
+    periods = []
+    if len(years) > 1:
+        for year, hits in years.items():
+            first = datetime.date(year, 1, 1)
+            periods.append((str(year), first, first.replace(month=12, day=31), hits))
+    else:
+        for month, hits in months.items():
+            first = datetime.date.fromisoformat(f"{month}-01")
+            last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+            periods.append((first.strftime("%b %Y"), first, last, hits))
+    buttons = [
+        htpy.button(
+            ".btn.btn-outline-secondary.btn-sm"
+            + (".active" if (first, last) == (start, end) else ""),
+            hx_include="form",
+            hx_post=flask.url_for("search", **_search_range(first, last)),
+            hx_target="#search-results",
+            type="button",
+        )[label, " ", htpy.span(".badge.text-bg-secondary")[hits]]
+        for label, first, last, hits in periods
+    ]
+    if start or end:
+        buttons.append(
+            htpy.button(
+                ".btn.btn-outline-danger.btn-sm",
+                aria_label="Search all dates",
+                hx_include="form",
+                hx_post=flask.url_for("search"),
+                hx_target="#search-results",
+                type="button",
+            )[htpy.i(".bi-x-lg")]
+        )
+    total = sum(months.values())
+    return htpy.div(".align-items-center.d-flex.flex-wrap.gap-1.mb-2")[
+        htpy.span(".me-2")[f"{total} {'entry' if total == 1 else 'entries'}"],
+        buttons,
+    ]
+
+
+def _search_range(start: datetime.date | None, end: datetime.date | None) -> dict:
+    """Query arguments that keep a search within its dates."""
+    args = {}
+    if start:
+        args["start"] = start.isoformat()
+    if end:
+        args["end"] = end.isoformat()
+    return args
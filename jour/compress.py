@@ -0,0 +1,269 @@
+import collections
+import collections.abc
+import re
+import threading
+import typing
+import zlib
+
+import werkzeug.datastructures
+import werkzeug.http
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+try:
+    from compression import zstd
+except ModuleNotFoundError:
+    zstd = None
+
+if typing.TYPE_CHECKING:
+    from _typeshed import OptExcInfo
+    from _typeshed.wsgi import StartResponse, WSGIApplication, WSGIEnvironment
+
+COMPRESSIBLE_TYPES = (
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+    "text/",
+)
+ETAG_SUFFIX = re.compile(r'-(?:br|gzip|zstd)"')
+
+
+class _Compressor(typing.Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+    def sync(self) -> bytes: ...
+
+
+class _Brotli:
+    def __init__(self) -> None:
+        if brotli is None:
+            raise ModuleNotFoundError("No module named 'brotli'")
+        # Quality 11, the default, is too slow to run on every response
+        self.c = brotli.Compressor(quality=5)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.c.process(data)
+
+    def flush(self) -> bytes:
+        return self.c.finish()
+
+    def sync(self) -> bytes:
+        return self.c.flush()
+
+
+class _Gzip:
+    def __init__(self) -> None:
+        self.c = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.c.compress(data)
+
+    def flush(self) -> bytes:
+        return self.c.flush()
+
+    def sync(self) -> bytes:
+        return self.c.flush(zlib.Z_SYNC_FLUSH)
+
+
+class _Zstd:
+    def __init__(self) -> None:
+        if zstd is None:
+            raise ModuleNotFoundError("No module named 'compression.zstd'")
+        self.c = zstd.ZstdCompressor(level=3)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.c.compress(data)
+
+    def flush(self) -> bytes:
+        return self.c.flush()
+
+    def sync(self) -> bytes:
+        return self.c.flush(self.c.FLUSH_BLOCK)
+
+
+def _encodings() -> dict[str, collections.abc.Callable[[], _Compressor]]:
+    """Supported encodings, most preferred first."""
+    result = {}
+    if zstd is not None:
+        result["zstd"] = _Zstd
+    if brotli is not None:
+        result["br"] = _Brotli
+    result["gzip"] = _Gzip
+    return result
+
+
+class _CompressedCache:
+    """Compressed bodies of responses with an ETag, bounded by total size."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: collections.OrderedDict[tuple[str, str], bytes] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[str, str]) -> bytes | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple[str, str], value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """Compress responses with the best encoding the client accepts.
+
+    Bodies are compressed as they stream. A body without a Content-Length is
+    flushed after every chunk, so a client gets each part of a streamed page
+    as soon as the app sends it. Responses smaller than min_size,
+    already encoded or not text are passed through. A compressed response gets
+    its own ETag, made by appending the encoding to the app's ETag, and the
+    compressed body of a response with an ETag is kept so the next request for
+    the same representation does not compress it again."""
+
+    def __init__(
+        self,
+        app: WSGIApplication,
+        min_size: int = 512,
+        cache_bytes: int = 16 * 1024 * 1024,
+    ) -> None:
+        self.app = app
+        self.cache = _CompressedCache(cache_bytes)
+        self.encodings = _encodings()
+        self.min_size = min_size
+
+    def _negotiate(self, accept_encoding: str) -> str | None:
+        accepted = werkzeug.http.parse_accept_header(accept_encoding)
+        for encoding in self.encodings:
+            if accepted[encoding]:
+                return encoding
+        return None
+
+    def __call__(
+        self, environ: WSGIEnvironment, start_response: StartResponse
+    ) -> collections.abc.Iterable[bytes]:
+        encoding = self._negotiate(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return self.app(environ, start_response)
+        if "HTTP_IF_NONE_MATCH" in environ:
+            # Let the app compare against the ETags it knows about
+            environ["HTTP_IF_NONE_MATCH"] = ETAG_SUFFIX.sub(
+                '"', environ["HTTP_IF_NONE_MATCH"]
+            )
+
+        captured = []
+
+        def _start_response(
+            status: str,
+            headers: list[tuple[str, str]],
+            exc_info: OptExcInfo | None = None,
+        ) -> collections.abc.Callable[[bytes], object]:
+            captured[:] = [status, headers, exc_info]
+            return lambda _: None
+
+        body = self.app(environ, _start_response)
+        chunks = iter(body)
+        first = [] if captured else [next(chunks, b"")]
+        status, headers, exc_info = captured
+        h = werkzeug.datastructures.Headers(headers)
+        etag = h.get("ETag")
+        if status.startswith("304") and etag:
+            h["ETag"] = f'{etag[:-1]}-{encoding}"'
+            _vary(h)
+            start_response(status, h.to_wsgi_list(), exc_info)
+            return _chain(first, chunks, body) if first else body
+        content_type = h.get("Content-Type", "")
+        length = h.get("Content-Length", type=int)
+        if (
+            not status.startswith("200")
+            or "Content-Encoding" in h
+            or not content_type.startswith(COMPRESSIBLE_TYPES)
+            or (length is not None and length < self.min_size)
+        ):
+            start_response(status, headers, exc_info)
+            return _chain(first, chunks, body) if first else body
+        h["Content-Encoding"] = encoding
+        _vary(h)
+        h.remove("Content-Length")
+        if etag:
+            h["ETag"] = f'{etag[:-1]}-{encoding}"'
+            cached = self.cache.get((etag, encoding))
+            if cached is not None:
+                _close(body)
+                h["Content-Length"] = str(len(cached))
+                start_response(status, h.to_wsgi_list(), exc_info)
+                return [cached]
+        start_response(status, h.to_wsgi_list(), exc_info)
+        return self._compress(encoding, etag, length is None, first, chunks, body)
+
+    def _compress(
+        self,
+        encoding: str,
+        etag: str | None,
+        sync: bool,
+        first: list[bytes],
+        chunks: collections.abc.Iterator[bytes],
+        body: collections.abc.Iterable[bytes],
+    ) -> collections.abc.Iterator[bytes]:
+        c = self.encodings[encoding]()
+        # Only bodies with an ETag can be found in the cache again
+        kept = []
+        try:
+            for chunk in _chain(first, chunks):
+                data = c.compress(chunk)
+                if sync:
+                    data += c.sync()
+                if data:
+                    if etag:
+                        kept.append(data)
+                    yield data
+            data = c.flush()
+            if etag:
+                kept.append(data)
+                self.cache.put((etag, encoding), b"".join(kept))
+            yield data
+        finally:
+            _close(body)
+
+
+def _chain(
+    first: list[bytes],
+    chunks: collections.abc.Iterator[bytes],
+    body: collections.abc.Iterable[bytes] | None = None,
+) -> collections.abc.Iterator[bytes]:
+    try:
+        yield from first
+        yield from chunks
+    finally:
+        if body is not None:
+            _close(body)
+
+
+def _vary(h: werkzeug.datastructures.Headers) -> None:
+    vary = werkzeug.http.parse_set_header(h.get("Vary"))
+    vary.add("Accept-Encoding")
+    h["Vary"] = vary.to_header()
+
+
+def _close(body: collections.abc.Iterable[bytes]) -> None:
+    close = getattr(body, "close", None)
+    if close is not None:
+        close()
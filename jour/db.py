@@ -0,0 +1,239 @@
+import collections.abc
+import concurrent.futures
+import functools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import fort
+
+PRAGMAS = {
+    "busy_timeout": 5000,
+    "cache_size": -16000,
+    "journal_mode": "wal",
+    "mmap_size": 268435456,
+    "synchronous": "normal",
+}
+# Statements slower than this, in milliseconds, are logged with their query plan
+SLOW_QUERY_MS = 100.0
+
+
+class _QueryStats:
+    """Calls, time and rows per statement in this process, since last taken."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # statement: [calls, total seconds, max seconds, rows]
+        self.pending: dict[str, list] = {}
+
+    def record(self, sql: str, seconds: float, rows: int) -> None:
+        statement = _normalize(sql)
+        with self.lock:
+            s = self.pending.get(statement)
+            if s is None:
+                self.pending[statement] = [1, seconds, seconds, rows]
+            else:
+                s[0] += 1
+                s[1] += seconds
+                s[2] = max(s[2], seconds)
+                s[3] += rows
+
+    def take(self) -> dict[str, list]:
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+
+_query_stats = _QueryStats()
+
+
+@functools.lru_cache(maxsize=512)
+def _normalize(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+class Database(fort.SQLiteDatabase):
+    """A fort.SQLiteDatabase that can be handed between threads by a Pool.
+
+    Pragmas are applied once, when the connection is opened. Every statement
+    run through q, q_one, q_val and u is timed, and one slower than
+    slow_query_ms is logged with its query plan."""
+
+    def __init__(self, dsn: str, slow_query_ms: float = SLOW_QUERY_MS) -> None:
+        self.log = logging.getLogger(__name__)
+        self.slow_query_ms = slow_query_ms
+        self.cnx = sqlite3.connect(
+            dsn, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        self.cnx.isolation_level = None
+        self.cnx.row_factory = sqlite3.Row
+        for k, v in PRAGMAS.items():
+            self.cnx.execute(f"pragma {k} = {v}")
+        self.cnx.set_trace_callback(self.log.debug)
+
+    def _explain(self, sql: str, params: dict) -> str:
+        try:
+            plan = self.cnx.execute(f"explain query plan {sql}", params).fetchall()
+        except sqlite3.Error as e:
+            return f"  (no query plan: {e})"
+        depth = {0: 0}
+        lines = []
+        for node_id, parent, _, detail in plan:
+            depth[node_id] = depth.get(parent, 0) + 1
+            lines.append(f"{'  ' * depth[node_id]}{detail}")
+        return "\n".join(lines)
+
+    def _q_gen(
+        self, sql: str, params: dict | None = None
+    ) -> collections.abc.Iterator[dict]:
+        params = params or {}
+        started = time.perf_counter()
+        cursor = self.cnx.execute(sql, params)
+        rows = 0
+        try:
+            for row in cursor:
+                rows += 1
+                yield row
+        finally:
+            # q_one and q_val stop early, which also ends up here
+            self._record(sql, params, time.perf_counter() - started, rows)
+
+    def _record(self, sql: str, params: dict, seconds: float, rows: int) -> None:
+        _query_stats.record(sql, seconds, rows)
+        if seconds * 1000 >= self.slow_query_ms:
+            message = f"Slow query, {seconds * 1000:.1f} ms and {rows} rows:"
+            plan = self._explain(sql, params)
+            self.log.warning(f"{message}\n  {_normalize(sql)}\n{plan}".rstrip())
+
+    def close(self) -> None:
+        self.cnx.close()
+
+    def u(self, sql: str, params: dict | None = None) -> int:
+        params = params or {}
+        started = time.perf_counter()
+        rows = self.cnx.execute(sql, params).rowcount
+        self._record(sql, params, time.perf_counter() - started, max(rows, 0))
+        return rows
+
+
+class GroupCommit:
+    """Run writes from many threads on one connection, several per transaction.
+
+    A write waits while the transaction before it commits, then goes into the
+    next one with every write that arrived in the meantime, so concurrent saves
+    share one commit and one new segment in each full-text index. Each write
+    runs in a savepoint, so one that fails does not undo the others."""
+
+    def __init__(
+        self,
+        db: Database,
+        max_batch: int = 64,
+    ) -> None:
+        self.db = db
+        self.max_batch = max_batch
+        self._queue: queue.SimpleQueue[tuple] = queue.SimpleQueue()
+        threading.Thread(target=self._run, name="group-commit", daemon=True).start()
+
+    def _commit(self, batch: list[tuple]) -> None:
+        results = []
+        try:
+            self.db.u("begin immediate")
+            for future, f, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.db.u("savepoint write")
+                try:
+                    result = f(self.db, *args)
+                except Exception as e:
+                    self.db.u("rollback to write")
+                    self.db.u("release write")
+                    future.set_exception(e)
+                else:
+                    self.db.u("release write")
+                    results.append((future, result))
+            self.db.u("commit")
+        except Exception as e:
+            if self.db.cnx.in_transaction:
+                self.db.cnx.rollback()
+            for future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in results:
+            future.set_result(result)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def submit(
+        self,
+        f: collections.abc.Callable,
+        *args: object,
+    ) -> concurrent.futures.Future:
+        """Call f(db, *args) in the next transaction."""
+        future = concurrent.futures.Future()
+        self._queue.put((future, f, args))
+        return future
+
+
+class Pool:
+    """A bounded pool of Database connections.
+
+    At most `size` connections are checked out at once. Connections are opened
+    lazily and reused most-recently-returned first."""
+
+    def __init__(
+        self,
+        dsn: str,
+        size: int = 8,
+        timeout: float = 30.0,
+        slow_query_ms: float = SLOW_QUERY_MS,
+    ) -> None:
+        self.dsn = dsn
+        self.size = size
+        self.slow_query_ms = slow_query_ms
+        self.timeout = timeout
+        self._idle: queue.LifoQueue[Database] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def get(self) -> Database:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection available in {self.timeout}s")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return Database(self.dsn, self.slow_query_ms)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def put(self, db: Database) -> None:
+        if db.cnx.in_transaction:
+            db.cnx.rollback()
+        self._idle.put(db)
+        self._slots.release()
+
+
+def take_query_stats() -> dict[str, list]:
+    """Return the statement stats recorded since the last call and start over.
+
+    Each value is [calls, total seconds, max seconds, rows]."""
+    return _query_stats.take()
@@ -0,0 +1,137 @@
+"""Time the phases of each request.
+
+The time spent in each phase goes into a Server-Timing header on the response
+and into a histogram for the route and phase. The histograms are served at
+/metrics in the Prometheus text format. Every process keeps its own, so with
+more than one worker each scrape sees the worker that answered it.
+
+A streamed body is made after its headers are sent, so for a streamed
+response Server-Timing stops at the headers, and the phases timed while the
+body is made only go into the histograms.
+"""
+
+import bisect
+import collections.abc
+import contextlib
+import threading
+import time
+
+import flask
+
+# Upper bounds, in seconds, of the histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+NAME = "jour_request_phase_seconds"
+
+
+class _Histogram:
+    def __init__(self) -> None:
+        # One count per bucket, and the last for values above every bucket
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+_histograms: dict[tuple[str, str], _Histogram] = {}
+_lock = threading.Lock()
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _observe(timings: dict[str, float]) -> None:
+    rule = flask.request.url_rule
+    route = rule.rule if rule else "unmatched"
+    with _lock:
+        for name, seconds in timings.items():
+            h = _histograms.get((route, name))
+            if h is None:
+                h = _histograms[(route, name)] = _Histogram()
+            h.observe(seconds)
+
+
+def finish(response: flask.Response) -> flask.Response:
+    """Add the Server-Timing header and record this request's phases."""
+    started = flask.g.get("started")
+    if started is None:
+        return response
+    timings = dict(flask.g.get("timings", {}))
+    timings["total"] = time.perf_counter() - started
+    response.headers["Server-Timing"] = ", ".join(
+        f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()
+    )
+    _observe(timings)
+    return response
+
+
+@contextlib.contextmanager
+def phase(name: str) -> collections.abc.Generator[None]:
+    """Add the time spent in the block to the named phase of the request.
+
+    Outside a request this does nothing. Phases should not be nested, or the
+    inner time is counted twice."""
+    if not flask.has_request_context():
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = flask.g.setdefault("timings", {})
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def render() -> str:
+    """Return every histogram in the Prometheus text format."""
+    with _lock:
+        snapshot = [
+            (route, name, list(h.counts), h.sum)
+            for (route, name), h in sorted(_histograms.items())
+        ]
+    lines = [
+        f"# HELP {NAME} Time spent in each phase of a request.",
+        f"# TYPE {NAME} histogram",
+    ]
+    for route, name, counts, total in snapshot:
+        labels = f'route="{_label(route)}",phase="{_label(name)}"'
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, "+Inf"), counts, strict=True):
+            cumulative += count
+            lines.append(f'{NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{NAME}_sum{{{labels}}} {total}")
+        lines.append(f"{NAME}_count{{{labels}}} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def start() -> None:
+    """Mark the start of a request."""
+    flask.g.started = time.perf_counter()
+
+
+def stream(chunks: collections.abc.Iterable[str]) -> collections.abc.Iterator[str]:
+    """Yield the chunks of a streamed body, then record the phases timed while
+    making them. Time spent making chunks that no other phase accounts for is
+    counted as render."""
+    timings = flask.g.setdefault("timings", {})
+    before = dict(timings)
+    making = 0.0
+    it = iter(chunks)
+    try:
+        while True:
+            started = time.perf_counter()
+            chunk = next(it, None)
+            making += time.perf_counter() - started
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        streamed = {
+            name: seconds - before.get(name, 0.0)
+            for name, seconds in timings.items()
+            if seconds != before.get(name)
+        }
+        streamed["render"] = making - sum(streamed.values())
+        _observe(streamed)
@@ -1,25 +1,21 @@
 import typing
 
-from . import journals, settings
+from . import drafts, import_checkpoints, journals, migrations, query_stats, settings
 
 if typing.TYPE_CHECKING:
     import fort
 
 
 def init(db: fort.SQLiteDatabase) -> None:
-    db.u("""
-        create table if not exists settings (
-            setting_id text primary key,
-            setting_value text
-        )
-    """)
-    db.u("""
-        create table if not exists journals (
-            journal_id uuid primary key,
-            journal_date date,
-            journal_data blob
-        )
-    """)
+    migrations.migrate(db)
 
 
-__all__ = [init, journals, settings]
+__all__ = [
+    drafts,
+    import_checkpoints,
+    init,
+    journals,
+    migrations,
+    query_stats,
+    settings,
+]
@@ -0,0 +1,96 @@
+import datetime
+import typing
+import uuid
+
+from . import journals
+
+if typing.TYPE_CHECKING:
+    import fort
+
+# Seconds without an autosave before a draft is saved as the entry
+IDLE_TIMEOUT = 300
+
+
+def delete(db: fort.SQLiteDatabase, date: datetime.date) -> None:
+    sql = """
+        delete from drafts
+        where journal_date = :journal_date
+    """
+    params = {
+        "journal_date": date,
+    }
+    db.u(sql, params)
+
+
+def get_for_date(db: fort.SQLiteDatabase, date: datetime.date) -> dict:
+    sql = """
+        select journal_date, draft_data, saved_at
+        from drafts
+        where journal_date = :journal_date
+    """
+    params = {
+        "journal_date": date,
+    }
+    row = db.q_one(sql, params)
+    return dict(row) if row else {}
+
+
+def list_idle(
+    db: fort.SQLiteDatabase, idle_timeout: int = IDLE_TIMEOUT
+) -> list[datetime.date]:
+    sql = """
+        select journal_date
+        from drafts
+        where saved_at < strftime('%Y-%m-%dT%H:%M:%fZ', 'now', :age)
+        order by journal_date
+    """
+    params = {
+        "age": f"-{idle_timeout} seconds",
+    }
+    return [row["journal_date"] for row in db.q(sql, params)]
+
+
+def promote(db: fort.SQLiteDatabase, date: datetime.date) -> None:
+    """Save the draft for a date as its entry and delete the draft."""
+    db.u("savepoint promote")
+    try:
+        draft = get_for_date(db, date)
+        if draft:
+            params = {
+                "journal_id": uuid.uuid4(),
+                "journal_date": date,
+                "journal_data": draft["draft_data"],
+            }
+            journals.upsert(db, params)
+            delete(db, date)
+        db.u("release promote")
+    except BaseException:
+        db.u("rollback to promote")
+        db.u("release promote")
+        raise
+
+
+def save(db: fort.SQLiteDatabase, date: datetime.date, text: str) -> None:
+    """Keep unsaved text for a date without touching the entry or its indexes.
+
+    Text that matches the saved entry is not a draft, so any draft for the
+    date is deleted instead. Saving the same draft again writes nothing."""
+    entry = journals.get_for_date(db, date)
+    if (entry["journal_data"] if entry else "") == text:
+        delete(db, date)
+        return
+    sql = """
+        insert into drafts (
+            journal_date, draft_data, saved_at
+        ) values (
+            :journal_date, :draft_data, strftime('%Y-%m-%dT%H:%M:%fZ')
+        ) on conflict (journal_date) do update set
+            draft_data = excluded.draft_data,
+            saved_at = excluded.saved_at
+        where draft_data is not excluded.draft_data
+    """
+    params = {
+        "journal_date": date,
+        "draft_data": text,
+    }
+    db.u(sql, params)
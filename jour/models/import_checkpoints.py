@@ -0,0 +1,44 @@
+import typing
+
+if typing.TYPE_CHECKING:
+    import fort
+
+
+def delete(db: fort.SQLiteDatabase, source: str) -> None:
+    sql = """
+        delete from import_checkpoints
+        where source = :source
+    """
+    params = {
+        "source": source,
+    }
+    db.u(sql, params)
+
+
+def get(db: fort.SQLiteDatabase, source: str) -> int:
+    """Return how many entries from source have been imported, or 0."""
+    sql = """
+        select entry_count
+        from import_checkpoints
+        where source = :source
+    """
+    params = {
+        "source": source,
+    }
+    return db.q_val(sql, params) or 0
+
+
+def save(db: fort.SQLiteDatabase, source: str, entry_count: int) -> None:
+    sql = """
+        insert into import_checkpoints (
+            source, entry_count
+        ) values (
+            :source, :entry_count
+        ) on conflict (source) do update set
+            entry_count = excluded.entry_count
+    """
+    params = {
+        "source": source,
+        "entry_count": entry_count,
+    }
+    db.u(sql, params)
@@ -1,19 +1,163 @@
+import collections
+import collections.abc
+import contextlib
 import datetime
+import re
+import sqlite3
+import threading
 import typing
+import uuid
 
 if typing.TYPE_CHECKING:
     import fort
 
 
+# Full-text indexes kept in sync with journals by triggers
+FTS_TABLES = ("journals_fts", "journals_trigram")
+# Segments FTS5 merges automatically, its default
+FTS_AUTOMERGE = 4
+# Results shown per page of search results
+PAGE_SIZE = 10
+# Pages of search results kept in memory
+SEARCH_CACHE_SIZE = 256
+# SQLite virtual machine instructions between checks for a cancelled search
+SEARCH_PROGRESS_STEPS = 1000
+# Most trigrams used in a fuzzy search
+TRIGRAM_LIMIT = 64
+
+UPSERT = """
+    insert into journals (
+        journal_id, journal_date, journal_data
+    ) values (
+        :journal_id, :journal_date, :journal_data
+    ) on conflict (journal_date) do update set
+        journal_data = excluded.journal_data
+    where journal_data is not excluded.journal_data
+"""
+
+QUERY_TOKEN = re.compile(r'"([^"]*)"|(\w+)')
+WORD = re.compile(r"\w+")
+
+
+class SearchCancelled(Exception):
+    """A search was interrupted because a newer search replaced it."""
+
+
+class SearchCursor(typing.NamedTuple):
+    """The sort key of the last search result on a page."""
+
+    rank: float
+    journal_id: str
+
+
 class SearchResult(typing.TypedDict):
     journal_date: datetime.date
+    journal_id: uuid.UUID
+    rank: float
     score: int
     snip: str
 
 
+class _SearchCache[V]:
+    """Recent search answers, keyed by the journal write counter.
+
+    Triggers bump the counter in the database on every write to journals, from
+    any process, so answers cached before the write are never returned again
+    and age out of the cache."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._entries: collections.OrderedDict[tuple, V] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> V | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: V) -> None:
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+# Match counts by month, and pages of search results
+_months_cache: _SearchCache[dict[str, int]] = _SearchCache(SEARCH_CACHE_SIZE)
+_search_cache: _SearchCache[list[SearchResult]] = _SearchCache(SEARCH_CACHE_SIZE)
+
+
+def bulk_upsert(db: fort.SQLiteDatabase, entries: list[dict]) -> None:
+    """Write many entries at once, in the caller's transaction.
+
+    Entries are matched by date like in upsert. If a date appears more than
+    once, the last entry wins. Running the same import twice writes nothing
+    the second time."""
+    db.b(UPSERT, entries)
+
+
+def count_by_month(
+    db: fort.SQLiteDatabase,
+    q: str,
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+    cancel: threading.Event | None = None,
+) -> dict[str, int]:
+    """Return how many entries match in each month, keyed by YYYY-MM.
+
+    One aggregate query over the match counts every entry without ranking or
+    snippeting any of them."""
+    match = fts_query(q)
+    if match is None:
+        return {}
+    key = (_write_count(db), match, start, end)
+    cached = _months_cache.get(key)
+    if cached is not None:
+        return cached
+    sql = """
+        select substr(j.journal_date, 1, 7) month, count(*) hits
+        from journals_fts f
+        cross join journals j on j.id = f.rowid
+        where journals_fts match :q
+        and j.journal_date between :start and :end
+        group by month
+        order by month
+    """
+    params = {
+        "q": match,
+        **_range(start, end),
+    }
+    months = {row["month"]: row["hits"] for row in _query(db, sql, params, cancel)}
+    _months_cache.put(key, months)
+    return months
+
+
+@contextlib.contextmanager
+def deferred_merges(db: fort.SQLiteDatabase) -> collections.abc.Generator[None]:
+    """Stop the full-text indexes from merging segments on every write in the
+    block.
+
+    A bulk import writes many small segments; merging them once at the end
+    with optimize_indexes is much cheaper than merging as it goes. The setting
+    is kept in the database, so automerge is turned back on however the block
+    exits. Otherwise an import that failed would leave every later write
+    adding segments that searches have to read."""
+    tables = _fts_tables(db)
+    for table in tables:
+        db.u(f"insert into {table} ({table}, rank) values ('automerge', 0)")  # noqa: S608
+    try:
+        yield
+    finally:
+        for table in tables:
+            sql = f"insert into {table} ({table}, rank) values ('automerge', :n)"  # noqa: S608
+            db.u(sql, {"n": FTS_AUTOMERGE})
+
+
 def delete(db: fort.SQLiteDatabase, date: datetime.date) -> None:
     sql = """
-        delete from journal_entries
+        delete from journals
         where journal_date = :journal_date
     """
     params = {
@@ -22,10 +166,43 @@ def delete(db: fort.SQLiteDatabase, date: datetime.date) -> None:
     db.u(sql, params)
 
 
+def fts_query(q: str) -> str | None:
+    """Turn search box input into an FTS5 query that cannot be malformed.
+
+    Words match as prefixes, text in double quotes matches as a phrase and OR
+    between two terms matches either. Other punctuation is ignored. Returns
+    None if there is nothing to search for."""
+    terms = []
+    for phrase, word in QUERY_TOKEN.findall(q):
+        if phrase:
+            words = WORD.findall(phrase)
+            if words:
+                terms.append(f'"{" ".join(words)}"')
+        elif word == "OR":
+            if terms and terms[-1] != "OR":
+                terms.append("OR")
+        elif len(word) > 1:
+            terms.append(f'"{word}"*')
+        else:
+            terms.append(f'"{word}"')
+    while terms and terms[-1] == "OR":
+        terms.pop()
+    return " ".join(terms) or None
+
+
+def _fts_tables(db: fort.SQLiteDatabase) -> list[str]:
+    sql = """
+        select name
+        from sqlite_master
+        where name in ('journals_fts', 'journals_trigram')
+    """
+    return [row["name"] for row in db.q(sql)]
+
+
 def get_for_date(db: fort.SQLiteDatabase, date: datetime.date) -> dict:
     sql = """
         select journal_id, journal_date, journal_data
-        from journal_entries
+        from journals
         where journal_date = :journal_date
     """
     params = {
@@ -34,12 +211,41 @@ def get_for_date(db: fort.SQLiteDatabase, date: datetime.date) -> dict:
     return db.q_one(sql, params) or {}
 
 
+def get_stamp(
+    db: fort.SQLiteDatabase, date: datetime.date, month: bool = False
+) -> dict:
+    """Return when the entry for a day, or any entry in its month, last changed.
+
+    The result has modified_at and version, or is empty if nothing has changed
+    since stamps were introduced."""
+    sql = """
+        select modified_at, version
+        from journal_stamps
+        where period = :period
+    """
+    params = {
+        "period": date.strftime("%Y-%m" if month else "%Y-%m-%d"),
+    }
+    row = db.q_one(sql, params)
+    return dict(row) if row else {}
+
+
+def iter_all(db: fort.SQLiteDatabase) -> collections.abc.Iterator[dict]:
+    """Yield every entry in date order without loading them all at once."""
+    sql = """
+        select journal_id, journal_date, journal_data
+        from journals
+        order by journal_date
+    """
+    yield from db.cnx.execute(sql)
+
+
 def list_dates_between(
     db: fort.SQLiteDatabase, start: datetime.date, end: datetime.date
 ) -> list[datetime.date]:
     sql = """
         select distinct journal_date
-        from journal_entries
+        from journals
         where journal_date between :start and :end
         order by journal_date
     """
@@ -47,57 +253,184 @@ def list_dates_between(
         "start": start,
         "end": end,
     }
-    return [
-        datetime.date.fromisoformat(row["journal_date"]) for row in db.q(sql, params)
-    ]
+    return [row["journal_date"] for row in db.q(sql, params)]
 
 
-def search(db: fort.SQLiteDatabase, q: str, page: int = 1) -> list[SearchResult]:
-    sql = """
-        select
-            journal_data, journal_date, printf('%.2f', rank * -1) score,
-            snippet(journal_entries, 2, '', '', ' ... ', 16) snip
-        from journal_entries
-        where journal_entries match :q
-        order by rank, journal_id
-        limit 11 offset :offset
-    """
-    params = {
-        "q": q,
-        "offset": 10 * (page - 1),
+def optimize_indexes(db: fort.SQLiteDatabase) -> None:
+    """Merge each full-text index into one segment."""
+    for table in _fts_tables(db):
+        db.u(f"insert into {table} ({table}) values ('optimize')")  # noqa: S608
+
+
+def _query(
+    db: fort.SQLiteDatabase,
+    sql: str,
+    params: dict,
+    cancel: threading.Event | None = None,
+) -> list[dict]:
+    """Run a query that raises SearchCancelled when cancel is set."""
+    if cancel is not None:
+        db.cnx.set_progress_handler(cancel.is_set, SEARCH_PROGRESS_STEPS)
+    try:
+        return db.q(sql, params)
+    except sqlite3.OperationalError:
+        if cancel is not None and cancel.is_set():
+            raise SearchCancelled from None
+        raise
+    finally:
+        if cancel is not None:
+            db.cnx.set_progress_handler(None, 0)
+
+
+def _range(start: datetime.date | None, end: datetime.date | None) -> dict:
+    # Matches are filtered by date as they are joined to journals, so entries
+    # outside the range are never ranked, snippeted or sorted. Looking up each
+    # entry in the range by rowid instead is much slower, since FTS5 reads its
+    # ranking statistics again for every lookup.
+    return {
+        "start": start or datetime.date.min,
+        "end": end or datetime.date.max,
     }
+
+
+def _search_rows(
+    db: fort.SQLiteDatabase,
+    sql: str,
+    params: dict,
+    cancel: threading.Event | None = None,
+) -> list[SearchResult]:
+    rows = _query(db, sql, params, cancel)
     return [
         {
-            "journal_date": datetime.date.fromisoformat(row["journal_date"]),
+            "journal_date": row["journal_date"],
+            "journal_id": row["journal_id"],
+            "rank": row["rank"],
             "score": row["score"],
             "snip": row["snip"],
         }
-        for row in db.q(sql, params)
+        for row in rows
     ]
 
 
+def _search_trigram(
+    db: fort.SQLiteDatabase,
+    q: str,
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+    cancel: threading.Event | None = None,
+) -> list[SearchResult]:
+    match = trigram_query(q)
+    sql = """
+        select 1
+        from sqlite_master
+        where name = 'journals_trigram'
+    """
+    if match is None or db.q_val(sql) is None:
+        return []
+    # snippet() repeats text when tokens overlap, as trigrams do
+    sql = """
+        select
+            j.journal_date, j.journal_id, f.rank,
+            printf('%.2f', f.rank * -1) score,
+            substr(j.journal_data, 1, 100) snip
+        from journals_trigram f
+        cross join journals j on j.id = f.rowid
+        where journals_trigram match :q
+        and j.journal_date between :start and :end
+        order by f.rank, j.journal_id
+        limit :limit
+    """
+    params = {
+        "q": match,
+        **_range(start, end),
+        "limit": PAGE_SIZE,
+    }
+    return _search_rows(db, sql, params, cancel)
+
+
+def search(
+    db: fort.SQLiteDatabase,
+    q: str,
+    after: SearchCursor | None = None,
+    cancel: threading.Event | None = None,
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+) -> list[SearchResult]:
+    """Return up to PAGE_SIZE + 1 results that sort after the cursor.
+
+    Paging by cursor instead of offset means later pages do not rank, snippet
+    and throw away every result before them. An extra result is returned when
+    there is another page. If the first page is empty, a single page of fuzzy
+    matches from the trigram index is returned instead. Only entries dated
+    from start to end, inclusive, are searched.
+
+    Setting cancel while the query runs interrupts it and raises
+    SearchCancelled."""
+    match = fts_query(q)
+    if match is None:
+        return []
+    # The count is read before searching, so results are never cached under a
+    # count older than the entries they were found in
+    key = (_write_count(db), match, after, start, end)
+    cached = _search_cache.get(key)
+    if cached is not None:
+        return cached
+    sql = """
+        select
+            j.journal_date, j.journal_id, f.rank,
+            printf('%.2f', f.rank * -1) score,
+            snippet(journals_fts, 0, '', '', ' ... ', 16) snip
+        from journals_fts f
+        cross join journals j on j.id = f.rowid
+        where journals_fts match :q
+        and j.journal_date between :start and :end
+        and (
+            :after_rank is null
+            or f.rank > :after_rank
+            or (f.rank = :after_rank and j.journal_id > :after_id)
+        )
+        order by f.rank, j.journal_id
+        limit :limit
+    """
+    params = {
+        "q": match,
+        "after_rank": None if after is None else after.rank,
+        "after_id": None if after is None else after.journal_id,
+        **_range(start, end),
+        "limit": PAGE_SIZE + 1,
+    }
+    results = _search_rows(db, sql, params, cancel)
+    if not results and after is None:
+        results = _search_trigram(db, q, start, end, cancel)
+    _search_cache.put(key, results)
+    return results
+
+
+def trigram_query(q: str) -> str | None:
+    """Turn search box input into a query for the trigram index.
+
+    Matching any trigram of any word and ranking by how many match finds
+    entries with misspelled or partial words."""
+    trigrams = dict.fromkeys(
+        w[i : i + 3] for w in WORD.findall(q.lower()) for i in range(len(w) - 2)
+    )
+    if not trigrams:
+        return None
+    return " OR ".join(f'"{t}"' for t in list(trigrams)[:TRIGRAM_LIMIT])
+
+
 def upsert(db: fort.SQLiteDatabase, params: dict) -> None:
-    journal_id = params.get("journal_id")
+    """Save the entry for a date, adding it if there is none.
+
+    journal_id is only used for a new entry. Saving the same text again writes
+    nothing, so the full-text indexes and stamps are left alone."""
+    db.u(UPSERT, params)
+
+
+def _write_count(db: fort.SQLiteDatabase) -> int:
     sql = """
-        select journal_id
-        from journal_entries
-        where journal_id = :journal_id
+        select write_count
+        from journal_writes
+        where id = 1
     """
-    existing = db.q_one(sql, params)
-    if existing:
-        db.log.debug(f"Update existing journal entry {journal_id}")
-        sql = """
-            update journal_entries
-            set journal_date = :journal_date, journal_data = :journal_data
-            where journal_id = :journal_id
-        """
-    else:
-        db.log.debug(f"Insert new journal entry {journal_id}")
-        sql = """
-            insert into journal_entries (
-                journal_id, journal_date, journal_data
-            ) values (
-                :journal_id, :journal_date, :journal_data
-            )
-        """
-    db.u(sql, params)
+    return db.q_val(sql)
@@ -0,0 +1,381 @@
+import collections.abc
+import sqlite3
+import typing
+
+if typing.TYPE_CHECKING:
+    import fort
+
+# Rows per transaction for migrations that touch every entry
+BATCH_SIZE = 500
+
+
+def _build_fts(
+    db: fort.SQLiteDatabase, fts_table: str, columns: str = "journal_data"
+) -> collections.abc.Iterator[None]:
+    """Index every journal entry in an external-content FTS table, in batches."""
+    db.u(f"insert into {fts_table} ({fts_table}) values ('delete-all')")  # noqa: S608
+    after = 0
+    while True:
+        yield
+        sql = """
+            select max(id)
+            from (
+                select id
+                from journals
+                where id > :after
+                order by id
+                limit :batch_size
+            )
+        """
+        last = db.q_val(sql, {"after": after, "batch_size": BATCH_SIZE})
+        if last is None:
+            return
+        sql = f"""
+            insert into {fts_table} (rowid, {columns})
+            select id, {columns}
+            from journals
+            where id > :after and id <= :last
+        """  # noqa: S608
+        db.u(sql, {"after": after, "last": last})
+        db.log.info(f"Indexed journal entries up to {last} in {fts_table}")
+        after = last
+
+
+def _columns(db: fort.SQLiteDatabase, table: str) -> set[str]:
+    return {row["name"] for row in db.q(f"pragma table_info({table})")}
+
+
+def _create_fts(db: fort.SQLiteDatabase, fts_table: str, options: str = "") -> None:
+    """Create an external-content FTS table over journals and its sync triggers."""
+    db.u(f"""
+        create virtual table if not exists {fts_table} using fts5 (
+            journal_data, content='journals', content_rowid='id'{options}
+        )
+    """)
+    db.u(f"""
+        create trigger if not exists {fts_table}_ai after insert on journals begin
+            insert into {fts_table} (rowid, journal_data)
+            values (new.id, new.journal_data);
+        end
+    """)  # noqa: S608
+    db.u(f"""
+        create trigger if not exists {fts_table}_ad after delete on journals begin
+            insert into {fts_table} ({fts_table}, rowid, journal_data)
+            values ('delete', old.id, old.journal_data);
+        end
+    """)  # noqa: S608
+    db.u(f"""
+        create trigger if not exists {fts_table}_au
+        after update of journal_data on journals begin
+            insert into {fts_table} ({fts_table}, rowid, journal_data)
+            values ('delete', old.id, old.journal_data);
+            insert into {fts_table} (rowid, journal_data)
+            values (new.id, new.journal_data);
+        end
+    """)  # noqa: S608
+
+
+def _drop_fts(db: fort.SQLiteDatabase, fts_table: str, triggers: str) -> None:
+    for suffix in ("ai", "ad", "au"):
+        db.u(f"drop trigger if exists {triggers}_{suffix}")
+    db.u(f"drop table if exists {fts_table}")
+
+
+def _v1_settings(db: fort.SQLiteDatabase) -> None:
+    db.u("""
+        create table if not exists settings (
+            setting_id text primary key,
+            setting_value text
+        )
+    """)
+
+
+def _v2_journals(db: fort.SQLiteDatabase) -> collections.abc.Iterator[None]:
+    """Move journal entries into a regular table with a separate full-text index.
+
+    Entries used to live only in the journal_entries FTS5 table, so every
+    lookup by date was a full scan. The journals table has a stable integer
+    rowid, so it can be the external content table for journals_fts."""
+    legacy_columns = _columns(db, "journals")
+    if legacy_columns and "id" not in legacy_columns:
+        db.u("alter table journals rename to journals_legacy")
+    db.u("""
+        create table if not exists journals (
+            id integer primary key,
+            journal_id uuid not null unique,
+            journal_date date not null,
+            journal_data text not null default ''
+        )
+    """)
+    db.u("""
+        create index if not exists journals_journal_date
+        on journals (journal_date)
+    """)
+    if _columns(db, "journal_entries"):
+        db.u("""
+            insert into journals (journal_id, journal_date, journal_data)
+            select journal_id, journal_date, coalesce(journal_data, '')
+            from journal_entries
+            order by journal_date
+        """)
+        db.u("drop table journal_entries")
+    if _columns(db, "journals_legacy"):
+        db.u("""
+            insert into journals (journal_id, journal_date, journal_data)
+            select journal_id, journal_date, coalesce(journal_data, '')
+            from journals_legacy
+            where journal_id not in (select journal_id from journals)
+            order by journal_date
+        """)
+        db.u("drop table journals_legacy")
+    db.u("""
+        create virtual table if not exists journals_fts using fts5 (
+            journal_data, content='journals', content_rowid='id'
+        )
+    """)
+    db.u("""
+        create trigger if not exists journals_ai after insert on journals begin
+            insert into journals_fts (rowid, journal_data)
+            values (new.id, new.journal_data);
+        end
+    """)
+    db.u("""
+        create trigger if not exists journals_ad after delete on journals begin
+            insert into journals_fts (journals_fts, rowid, journal_data)
+            values ('delete', old.id, old.journal_data);
+        end
+    """)
+    db.u("""
+        create trigger if not exists journals_au
+        after update of journal_data on journals begin
+            insert into journals_fts (journals_fts, rowid, journal_data)
+            values ('delete', old.id, old.journal_data);
+            insert into journals_fts (rowid, journal_data)
+            values (new.id, new.journal_data);
+        end
+    """)
+    yield from _build_fts(db, "journals_fts")
+
+
+def _v3_prefix_and_trigram_indexes(
+    db: fort.SQLiteDatabase,
+) -> collections.abc.Iterator[None]:
+    """Rebuild journals_fts with prefix indexes and add a trigram index.
+
+    Prefix indexes keep short prefix queries like "va"* from scanning every
+    term in the index. The trigram index backs substring and typo-tolerant
+    matching, and is skipped when SQLite is too old for the trigram tokenizer.
+
+    Both indexes are rebuilt even when their tables already exist, since a
+    migration that was interrupted leaves the new tables partly filled."""
+    sql = """
+        select sql
+        from sqlite_master
+        where name = 'journals_fts'
+    """
+    if "prefix" not in (db.q_val(sql) or ""):
+        _drop_fts(db, "journals_fts", "journals")
+        _create_fts(db, "journals_fts", ", prefix='2 3'")
+    yield from _build_fts(db, "journals_fts")
+    if not _columns(db, "journals_trigram"):
+        try:
+            _create_fts(db, "journals_trigram", ", tokenize='trigram'")
+        except sqlite3.OperationalError as e:
+            db.log.warning(f"Not creating trigram index: {e}")
+            return
+    yield from _build_fts(db, "journals_trigram")
+
+
+def _v4_journal_stamps(db: fort.SQLiteDatabase) -> None:
+    """Track when each day and month last changed, for HTTP conditional requests.
+
+    period is either YYYY-MM-DD or YYYY-MM. version goes up by one on every
+    change, so two changes in the same millisecond still differ."""
+    db.u("""
+        create table if not exists journal_stamps (
+            period text primary key,
+            modified_at text not null,
+            version integer not null
+        ) without rowid
+    """)
+    stamp = """
+        insert into journal_stamps (period, modified_at, version)
+        values
+            ({row}.journal_date, strftime('%Y-%m-%dT%H:%M:%fZ'), 1),
+            (substr({row}.journal_date, 1, 7), strftime('%Y-%m-%dT%H:%M:%fZ'), 1)
+        on conflict (period) do update set
+            modified_at = excluded.modified_at,
+            version = version + 1;
+    """
+    db.u(f"""
+        create trigger if not exists journal_stamps_ai
+        after insert on journals begin
+            {stamp.format(row="new")}
+        end
+    """)
+    db.u(f"""
+        create trigger if not exists journal_stamps_ad
+        after delete on journals begin
+            {stamp.format(row="old")}
+        end
+    """)
+    db.u(f"""
+        create trigger if not exists journal_stamps_au
+        after update on journals begin
+            {stamp.format(row="old")}
+            {stamp.format(row="new")}
+        end
+    """)
+
+
+def _v5_unique_journal_date(db: fort.SQLiteDatabase) -> None:
+    """Allow one entry per date, so saving an entry is a single upsert.
+
+    Where a date has more than one entry, their text is joined into the oldest
+    entry, in the order they were added, and the others are deleted."""
+    db.u("""
+        update journals
+        set journal_data = (
+            select group_concat(d.journal_data, char(10) || char(10))
+            from (
+                select journal_data
+                from journals d
+                where d.journal_date = journals.journal_date
+                order by d.id
+            ) d
+        )
+        where id in (
+            select min(id)
+            from journals
+            group by journal_date
+            having count(*) > 1
+        )
+    """)
+    db.u("""
+        delete from journals
+        where id not in (
+            select min(id)
+            from journals
+            group by journal_date
+        )
+    """)
+    db.u("drop index if exists journals_journal_date")
+    db.u("""
+        create unique index if not exists journals_journal_date
+        on journals (journal_date)
+    """)
+
+
+def _v6_drafts(db: fort.SQLiteDatabase) -> None:
+    """Keep autosaved text apart from journals, so it is not indexed."""
+    db.u("""
+        create table if not exists drafts (
+            journal_date date primary key,
+            draft_data text not null,
+            saved_at text not null
+        )
+    """)
+
+
+def _v7_query_stats(db: fort.SQLiteDatabase) -> None:
+    """Totals per statement, added to by every process that serves the app."""
+    db.u("""
+        create table if not exists query_stats (
+            statement text primary key,
+            calls integer not null,
+            total_ms real not null,
+            max_ms real not null,
+            row_count integer not null
+        )
+    """)
+
+
+def _v8_journal_writes(db: fort.SQLiteDatabase) -> None:
+    """Count writes to journals, so every process can tell when its cached
+    search results are out of date with one primary key lookup."""
+    db.u("""
+        create table if not exists journal_writes (
+            id integer primary key check (id = 1),
+            write_count integer not null
+        )
+    """)
+    db.u("""
+        insert into journal_writes (id, write_count)
+        values (1, 0)
+        on conflict (id) do nothing
+    """)
+    for event, suffix in (("insert", "ai"), ("delete", "ad"), ("update", "au")):
+        db.u(f"""
+            create trigger if not exists journal_writes_{suffix}
+            after {event} on journals begin
+                update journal_writes
+                set write_count = write_count + 1
+                where id = 1;
+            end
+        """)  # noqa: S608
+
+
+def _v9_import_checkpoints(db: fort.SQLiteDatabase) -> None:
+    """Keep import progress apart from settings.
+
+    Saving progress as a setting changed the settings version with every
+    batch, so every process reloaded its settings while an import ran."""
+    db.u("""
+        create table if not exists import_checkpoints (
+            source text primary key,
+            entry_count integer not null
+        )
+    """)
+    db.u("""
+        insert into import_checkpoints (source, entry_count)
+        select substr(setting_id, 8), cast(setting_value as integer)
+        from settings
+        where setting_id like 'import/%'
+        on conflict (source) do nothing
+    """)
+    db.u("""
+        delete from settings
+        where setting_id like 'import/%'
+    """)
+
+
+# Append only. The position of a migration in this list is its schema version.
+MIGRATIONS: list[collections.abc.Callable] = [
+    _v1_settings,
+    _v2_journals,
+    _v3_prefix_and_trigram_indexes,
+    _v4_journal_stamps,
+    _v5_unique_journal_date,
+    _v6_drafts,
+    _v7_query_stats,
+    _v8_journal_writes,
+    _v9_import_checkpoints,
+]
+
+
+def migrate(db: fort.SQLiteDatabase) -> None:
+    """Bring the schema up to date, one migration per transaction.
+
+    The schema version is kept in pragma user_version. A migration that yields
+    has its work committed at every yield, so long migrations do not hold one
+    huge transaction. Migrations must be safe to run again if interrupted."""
+    while True:
+        db.u("begin immediate")
+        try:
+            version = db.q_val("pragma user_version")
+            if version >= len(MIGRATIONS):
+                db.u("commit")
+                return
+            migration = MIGRATIONS[version]
+            db.log.info(f"Migrating schema to version {version + 1}")
+            steps = migration(db)
+            if steps is not None:
+                for _ in steps:
+                    db.u("commit")
+                    db.u("begin immediate")
+            db.u(f"pragma user_version = {version + 1}")
+            db.u("commit")
+        except BaseException:
+            if db.cnx.in_transaction:
+                db.u("rollback")
+            raise
@@ -0,0 +1,51 @@
+import typing
+
+if typing.TYPE_CHECKING:
+    import fort
+
+
+def add(db: fort.SQLiteDatabase, stats: dict[str, list]) -> None:
+    """Add statement stats from jour.db.take_query_stats to the totals."""
+    sql = """
+        insert into query_stats (
+            statement, calls, total_ms, max_ms, row_count
+        ) values (
+            :statement, :calls, :total_ms, :max_ms, :row_count
+        ) on conflict (statement) do update set
+            calls = calls + excluded.calls,
+            total_ms = total_ms + excluded.total_ms,
+            max_ms = max(max_ms, excluded.max_ms),
+            row_count = row_count + excluded.row_count
+    """
+    db.u("begin immediate")
+    try:
+        for statement, (calls, total, longest, rows) in stats.items():
+            params = {
+                "statement": statement,
+                "calls": calls,
+                "total_ms": total * 1000,
+                "max_ms": longest * 1000,
+                "row_count": rows,
+            }
+            db.u(sql, params)
+        db.u("commit")
+    except BaseException:
+        db.u("rollback")
+        raise
+
+
+def delete_all(db: fort.SQLiteDatabase) -> None:
+    db.u("delete from query_stats")
+
+
+def list_top(db: fort.SQLiteDatabase, limit: int = 20) -> list[dict]:
+    sql = """
+        select statement, calls, total_ms, max_ms, row_count
+        from query_stats
+        order by total_ms desc
+        limit :limit
+    """
+    params = {
+        "limit": limit,
+    }
+    return [dict(row) for row in db.q(sql, params)]
@@ -1,25 +1,82 @@
+import threading
+import time
 import typing
+import uuid
 
 import cryptography.fernet
 
 if typing.TYPE_CHECKING:
     import fort
 
+# How often, in seconds, to look for changes made by other processes
+CHECK_INTERVAL = 5.0
+VERSION_ID = "settings/version"
+
+
+class _Cache:
+    """Settings values shared by every Settings instance in this process.
+
+    The whole settings table is loaded at once. Every write also changes the
+    version row, so a change made by another process is noticed the next time
+    the version row is checked, at most once every CHECK_INTERVAL seconds."""
+
+    def __init__(self) -> None:
+        self.checked = 0.0
+        self.decrypted: dict[str, bytes] = {}
+        self.lock = threading.Lock()
+        self.values: dict[str, typing.Any] | None = None
+        self.version: str | None = None
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.values = None
+            self.decrypted = {}
+
+    def load(self, db: fort.SQLiteDatabase) -> dict[str, typing.Any]:
+        values = self.values
+        now = time.monotonic()
+        if values is not None and now - self.checked < CHECK_INTERVAL:
+            return values
+        with self.lock:
+            if self.values is not None and now - self.checked < CHECK_INTERVAL:
+                return self.values
+            if self.values is not None:
+                sql = """
+                    select setting_value
+                    from settings
+                    where setting_id = :setting_id
+                """
+                version = db.q_val(sql, {"setting_id": VERSION_ID})
+                if version != self.version:
+                    self.values = None
+            if self.values is None:
+                sql = """
+                    select setting_id, setting_value
+                    from settings
+                """
+                self.values = {
+                    row["setting_id"]: row["setting_value"] for row in db.q(sql)
+                }
+                self.decrypted = {}
+                self.version = self.values.get(VERSION_ID)
+            self.checked = now
+            return self.values
+
+
+_cache = _Cache()
+
+
+def invalidate() -> None:
+    """Forget cached settings, so the next read loads them from the database."""
+    _cache.invalidate()
+
 
 class Settings:
     def __init__(self, db: fort.SQLiteDatabase) -> None:
         self.db = db
 
     def _get(self, setting_id: str) -> typing.Any:  # noqa: ANN401
-        sql = """
-            select setting_value
-            from settings
-            where setting_id = :setting_id
-        """
-        params = {
-            "setting_id": setting_id,
-        }
-        return self.db.q_val(sql, params)
+        return _cache.load(self.db).get(setting_id)
 
     def _set(self, setting_id: str, setting_value: str) -> None:
         sql = """
@@ -27,20 +84,45 @@ class Settings:
                 setting_id, setting_value
             ) values (
                 :setting_id, :setting_value
+            ), (
+                :version_id, :version
             ) on conflict (setting_id) do update set
                 setting_value = excluded.setting_value
         """
         params = {
             "setting_id": setting_id,
             "setting_value": setting_value,
+            "version_id": VERSION_ID,
+            "version": str(uuid.uuid4()),
         }
         self.db.u(sql, params)
+        invalidate()
+
+    def delete(self, setting_id: str) -> None:
+        sql = """
+            delete from settings
+            where setting_id = :setting_id
+        """
+        self.db.u(sql, {"setting_id": setting_id})
+        sql = """
+            update settings
+            set setting_value = :version
+            where setting_id = :version_id
+        """
+        self.db.u(sql, {"version": str(uuid.uuid4()), "version_id": VERSION_ID})
+        invalidate()
 
     def get_enc(self, setting_id: str) -> bytes:
-        val = self._get(setting_id)
+        # Loading first checks the version, which clears stale decrypted values
+        values = _cache.load(self.db)
+        decrypted = _cache.decrypted
+        if setting_id in decrypted:
+            return decrypted[setting_id]
+        val = values.get(setting_id)
         if val:
             f = cryptography.fernet.Fernet(self.secret_key)
-            return f.decrypt(val)
+            decrypted[setting_id] = f.decrypt(val)
+            return decrypted[setting_id]
         return b""
 
     def get_str(self, setting_id: str) -> str:
@@ -50,11 +132,15 @@ class Settings:
         return ""
 
     def keys(self) -> set[str]:
-        sql = """
-            select setting_id
-            from settings
-        """
-        return set(row["setting_id"] for row in self.db.q(sql))
+        return set(_cache.load(self.db)) - {VERSION_ID}
+
+    @property
+    def metrics_token(self) -> str:
+        return self.get_enc("metrics/token").decode()
+
+    @metrics_token.setter
+    def metrics_token(self, value: str) -> None:
+        self.set_enc("metrics/token", value)
 
     @property
     def openid_client_id(self) -> str:
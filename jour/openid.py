@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+
+import httpx
+import jwt
+
+log = logging.getLogger(__name__)
+
+# Used when a response does not say how long it can be cached
+DEFAULT_MAX_AGE = 3600
+# Seconds to wait before refetching a key set for another unknown key id
+KEYSET_REFETCH_INTERVAL = 60
+
+
+def _max_age(response: httpx.Response) -> int:
+    for directive in response.headers.get("cache-control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        name = name.lower()
+        if name in ("no-cache", "no-store"):
+            return 0
+        if name == "max-age":
+            try:
+                return max(int(value.strip('"')), 0)
+            except ValueError:
+                return DEFAULT_MAX_AGE
+    return DEFAULT_MAX_AGE
+
+
+class Provider:
+    """Cached discovery documents and key sets for OpenID providers.
+
+    Documents are cached for as long as the provider's Cache-Control header
+    allows. A stale document is still returned while a background thread
+    fetches a fresh copy, so only the very first request for a URL waits on the
+    network. Pass clients to talk to a stub provider in tests.
+
+    The async client is for the ASGI server, so the token request and the
+    first fetch of a document wait on the event loop instead of a thread."""
+
+    def __init__(
+        self,
+        client: httpx.Client | None = None,
+        async_client: httpx.AsyncClient | None = None,
+    ) -> None:
+        self.async_client = async_client or httpx.AsyncClient(timeout=10)
+        self.client = client or httpx.Client(timeout=10)
+        self._documents: dict[str, tuple[dict, float]] = {}
+        self._keysets: dict[str, tuple[dict, jwt.PyJWKSet]] = {}
+        self._lock = threading.Lock()
+        self._refetched: dict[str, float] = {}
+        self._refreshing: set[str] = set()
+
+    def _fetch(self, url: str) -> dict:
+        return self._store(url, self.client.get(url))
+
+    def _keyset(self, url: str, refresh: bool = False) -> jwt.PyJWKSet:
+        data = self._fetch(url) if refresh else self.get_json(url)
+        cached = self._keysets.get(url)
+        if cached is not None and cached[0] is data:
+            return cached[1]
+        keyset = jwt.PyJWKSet.from_dict(data)
+        self._keysets[url] = (data, keyset)
+        return keyset
+
+    def _may_refetch(self, url: str) -> bool:
+        """Allow one refetch of url per KEYSET_REFETCH_INTERVAL.
+
+        Anyone can send a token with a made-up key id, so an unknown kid must
+        not turn every sign-in attempt into a request to the provider."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._refetched.get(url)
+            if last is not None and now - last < KEYSET_REFETCH_INTERVAL:
+                return False
+            self._refetched[url] = now
+        return True
+
+    def _refresh(self, url: str) -> None:
+        try:
+            self._fetch(url)
+        except httpx.HTTPError:
+            log.exception(f"Could not refresh {url}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(url)
+
+    def _refresh_in_background(self, url: str) -> None:
+        with self._lock:
+            if url in self._refreshing:
+                return
+            self._refreshing.add(url)
+        threading.Thread(target=self._refresh, args=(url,), daemon=True).start()
+
+    def _store(self, url: str, response: httpx.Response) -> dict:
+        response.raise_for_status()
+        data = response.json()
+        self._documents[url] = (data, time.monotonic() + _max_age(response))
+        return data
+
+    async def aget_json(self, url: str) -> dict:
+        """Like get_json, but wait for an uncached document on the event loop."""
+        if url in self._documents:
+            return self.get_json(url)
+        return self._store(url, await self.async_client.get(url))
+
+    def decode_id_token(
+        self, discovery_document_url: str, id_token: str, audience: str
+    ) -> dict:
+        """Verify the signature and claims of an ID token and return its claims."""
+        discovery_document = self.discovery_document(discovery_document_url)
+        jwks_uri = discovery_document["jwks_uri"]
+        kid = jwt.get_unverified_header(id_token).get("kid")
+        keyset = self._keyset(jwks_uri)
+        if (
+            kid is not None
+            and kid not in {k.key_id for k in keyset.keys}
+            and self._may_refetch(jwks_uri)
+        ):
+            # The provider may have rotated its keys since we last looked
+            keyset = self._keyset(jwks_uri, refresh=True)
+        keys = [k for k in keyset.keys if kid is None or k.key_id == kid]
+        if not keys:
+            raise jwt.InvalidKeyError(f"No key with id {kid}")
+        return jwt.decode(
+            id_token,
+            key=keys[0].key,
+            algorithms=discovery_document.get("id_token_signing_alg_values_supported"),
+            audience=audience,
+            issuer=discovery_document.get("issuer"),
+        )
+
+    def discovery_document(self, url: str) -> dict:
+        return self.get_json(url)
+
+    def get_json(self, url: str) -> dict:
+        """Return the cached JSON document at url, fetching it if necessary."""
+        cached = self._documents.get(url)
+        if cached is None:
+            return self._fetch(url)
+        data, expires = cached
+        if time.monotonic() >= expires:
+            self._refresh_in_background(url)
+        return data
+
+    def warm(self, discovery_document_url: str) -> None:
+        """Fetch the discovery document and key set in the background."""
+
+        def _warm() -> None:
+            try:
+                discovery_document = self._fetch(discovery_document_url)
+                self._keyset(discovery_document["jwks_uri"], refresh=True)
+            except httpx.HTTPError:
+                log.exception(f"Could not fetch {discovery_document_url}")
+
+        threading.Thread(target=_warm, daemon=True).start()
+
+
+provider = Provider()
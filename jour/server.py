@@ -0,0 +1,155 @@
+"""Serve a WSGI app on waitress, in one process or in several."""
+
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import typing
+
+import waitress.server
+import waitress.wasyncore
+
+if typing.TYPE_CHECKING:
+    import collections.abc
+
+    from _typeshed.wsgi import WSGIApplication
+
+log = logging.getLogger(__name__)
+
+# Seconds that requests in progress get to finish after SIGTERM
+DRAIN_TIMEOUT = 30.0
+# Seconds to wait before replacing a worker that exited on its own
+RESTART_DELAY = 1.0
+
+_draining = threading.Event()
+_server: waitress.server.BaseWSGIServer | None = None
+_workers: set[int] = set()
+
+
+def _busy(server: waitress.server.BaseWSGIServer) -> bool:
+    busy = False
+    for channel in list(server.active_channels.values()):
+        if channel.requests or channel.total_outbufs_len:
+            busy = True
+        else:
+            # An idle keep-alive connection would only bring more requests
+            channel.will_close = True
+    return busy
+
+
+def _listen(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # Every worker listens on the same port and the kernel spreads connections
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def _poll(server: waitress.server.BaseWSGIServer) -> None:
+    waitress.wasyncore.loop(
+        timeout=server.adj.asyncore_loop_timeout,
+        map=server._map,
+        use_poll=server.adj.asyncore_use_poll,
+        count=1,
+    )
+
+
+def _start_worker(
+    app: WSGIApplication,
+    after_fork: collections.abc.Callable[[], None],
+    host: str,
+    port: int,
+    backlog: int,
+    **kw: typing.Any,  # noqa: ANN401
+) -> int:
+    pid = os.fork()
+    if pid:
+        _workers.add(pid)
+        return pid
+    status = 0
+    try:
+        _workers.clear()
+        after_fork()
+        serve(app, sockets=[_listen(host, port, backlog)], backlog=backlog, **kw)
+    except SystemExit:
+        # SIGTERM before the server started left nothing to drain
+        pass
+    except BaseException:
+        log.exception(f"Worker {os.getpid()} failed")
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def drain() -> bool:
+    """Stop accepting connections and exit once requests in progress are done.
+
+    In a supervisor, each worker is told to drain. Returns False if there is
+    no server running in this process."""
+    if _server is None and not _workers:
+        return False
+    _draining.set()
+    for pid in list(_workers):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    return True
+
+
+def serve(
+    app: WSGIApplication,
+    drain_timeout: float = DRAIN_TIMEOUT,
+    **kw: typing.Any,  # noqa: ANN401
+) -> None:
+    """Serve app on waitress until drain is called.
+
+    kw are waitress options, such as host, port, threads, connection_limit,
+    channel_timeout and backlog."""
+    global _server
+    server = waitress.server.create_server(app, **kw)
+    server.print_listen("Serving on http://{}:{}")
+    _server = server
+    try:
+        while not _draining.is_set():
+            _poll(server)
+        log.info("Draining requests in progress")
+        # Stop listening, but keep the trigger that wakes the loop for responses
+        waitress.wasyncore.dispatcher.close(server)
+        deadline = time.monotonic() + drain_timeout
+        while _busy(server) and time.monotonic() < deadline:
+            _poll(server)
+    finally:
+        server.task_dispatcher.shutdown()
+        _server = None
+
+
+def serve_workers(
+    app: WSGIApplication,
+    workers: int,
+    after_fork: collections.abc.Callable[[], None],
+    host: str = "0.0.0.0",  # noqa: S104
+    port: int = 8080,
+    backlog: int = 1024,
+    **kw: typing.Any,  # noqa: ANN401
+) -> None:
+    """Serve app from several processes, each listening on the same port.
+
+    after_fork runs in each worker before it serves, to open what can not be
+    shared across a fork, like database connections. A worker that exits on
+    its own is replaced until drain is called."""
+    for _ in range(workers):
+        _start_worker(app, after_fork, host, port, backlog, **kw)
+    while _workers:
+        pid, status = os.wait()
+        _workers.discard(pid)
+        if _draining.is_set():
+            continue
+        log.warning(f"Worker {pid} exited with status {status}, starting another")
+        time.sleep(RESTART_DELAY)
+        _start_worker(app, after_fork, host, port, backlog, **kw)
@@ -0,0 +1,197 @@
+"""Import and export journal entries in bulk.
+
+Three formats are supported:
+
+jsonl
+    One JSON object per line with journal_id, journal_date (YYYY-MM-DD) and
+    journal_data. journal_id is optional when importing.
+markdown
+    A directory with one file per day at YYYY/MM/DD.md.
+dayone
+    A Day One JSON export. Entries on the same day are joined into one. The
+    path can be the JSON file or the directory it was unzipped into.
+"""
+
+import collections.abc
+import datetime
+import itertools
+import json
+import logging
+import pathlib
+import time
+import typing
+import uuid
+import zoneinfo
+
+import jour.models
+
+if typing.TYPE_CHECKING:
+    import fort
+
+log = logging.getLogger(__name__)
+
+# Entries written per transaction
+BATCH_SIZE = 2000
+FORMATS = ("dayone", "jsonl", "markdown")
+
+
+def _dayone_date(entry: dict) -> datetime.date:
+    created = datetime.datetime.fromisoformat(entry["creationDate"])
+    tz = entry.get("timeZone")
+    if tz:
+        try:
+            created = created.astimezone(zoneinfo.ZoneInfo(tz))
+        except ValueError, zoneinfo.ZoneInfoNotFoundError:
+            log.warning(f"Unknown time zone {tz}, using UTC")
+    return created.date()
+
+
+def _read_dayone(path: pathlib.Path) -> collections.abc.Iterator[dict]:
+    files = sorted(path.glob("*.json")) if path.is_dir() else [path]
+    days: dict[datetime.date, dict] = {}
+    for file in files:
+        with file.open(encoding="utf-8") as f:
+            entries = json.load(f).get("entries", [])
+        for entry in sorted(entries, key=lambda e: e["creationDate"]):
+            date = _dayone_date(entry)
+            text = entry.get("text", "")
+            if date in days:
+                days[date]["journal_data"] += f"\n\n{text}"
+            else:
+                days[date] = {
+                    "journal_id": uuid.UUID(entry["uuid"]),
+                    "journal_date": date,
+                    "journal_data": text,
+                }
+    for date in sorted(days):
+        yield days[date]
+
+
+def _read_jsonl(path: pathlib.Path) -> collections.abc.Iterator[dict]:
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            journal_id = record.get("journal_id")
+            yield {
+                "journal_id": uuid.UUID(journal_id) if journal_id else uuid.uuid4(),
+                "journal_date": datetime.date.fromisoformat(record["journal_date"]),
+                "journal_data": record.get("journal_data") or "",
+            }
+
+
+def _read_markdown(path: pathlib.Path) -> collections.abc.Iterator[dict]:
+    for file in sorted(path.glob("[0-9][0-9][0-9][0-9]/[0-9][0-9]/[0-9][0-9].md")):
+        year, month, day = file.parent.parent.name, file.parent.name, file.stem
+        yield {
+            "journal_id": uuid.uuid4(),
+            "journal_date": datetime.date(int(year), int(month), int(day)),
+            "journal_data": file.read_text(encoding="utf-8"),
+        }
+
+
+def _write_dayone(
+    path: pathlib.Path, entries: collections.abc.Iterable[dict]
+) -> collections.abc.Iterator[None]:
+    with path.open("w", encoding="utf-8") as f:
+        f.write('{"metadata": {"version": "1.0"}, "entries": [\n')
+        for i, entry in enumerate(entries):
+            record = {
+                "uuid": entry["journal_id"].hex.upper(),
+                # Entries have no time of day, so they are placed at noon
+                "creationDate": f"{entry['journal_date']}T12:00:00Z",
+                "text": entry["journal_data"],
+            }
+            f.write(f"{',' if i else ''}{json.dumps(record)}\n")
+            yield
+        f.write("]}\n")
+
+
+def _write_jsonl(
+    path: pathlib.Path, entries: collections.abc.Iterable[dict]
+) -> collections.abc.Iterator[None]:
+    with path.open("w", encoding="utf-8") as f:
+        for entry in entries:
+            record = {
+                "journal_id": str(entry["journal_id"]),
+                "journal_date": str(entry["journal_date"]),
+                "journal_data": entry["journal_data"],
+            }
+            f.write(f"{json.dumps(record)}\n")
+            yield
+
+
+def _write_markdown(
+    path: pathlib.Path, entries: collections.abc.Iterable[dict]
+) -> collections.abc.Iterator[None]:
+    for entry in entries:
+        file = path / entry["journal_date"].strftime("%Y/%m/%d.md")
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(entry["journal_data"], encoding="utf-8")
+        yield
+
+
+READERS = {
+    "dayone": _read_dayone,
+    "jsonl": _read_jsonl,
+    "markdown": _read_markdown,
+}
+WRITERS = {
+    "dayone": _write_dayone,
+    "jsonl": _write_jsonl,
+    "markdown": _write_markdown,
+}
+
+
+def export_entries(
+    db: fort.SQLiteDatabase, fmt: str, path: pathlib.Path
+) -> collections.abc.Iterator[int]:
+    """Write every entry to path, yielding the count every BATCH_SIZE entries
+    and at the end."""
+    count = 0
+    for _ in WRITERS[fmt](path, jour.models.journals.iter_all(db)):
+        count += 1
+        if count % BATCH_SIZE == 0:
+            yield count
+    if count % BATCH_SIZE or not count:
+        yield count
+
+
+def import_entries(
+    db: fort.SQLiteDatabase,
+    fmt: str,
+    path: pathlib.Path,
+    batch_size: int = BATCH_SIZE,
+    restart: bool = False,
+) -> collections.abc.Generator[int]:
+    """Import entries from path, yielding the count after every batch.
+
+    Each batch is one transaction. The number of entries read from path is
+    saved with each batch, so an import that is interrupted picks up after the
+    last batch it committed. Entries are matched to existing ones by date, so
+    importing the same entries again is safe. Pass restart to start over from
+    the first entry."""
+    checkpoints = jour.models.import_checkpoints
+    source = f"{fmt}/{path.resolve()}"
+    done = 0 if restart else checkpoints.get(db, source)
+    if done:
+        log.info(f"Resuming {path} after {done} entries")
+    entries = itertools.islice(READERS[fmt](path), done, None)
+    started = time.monotonic()
+    with jour.models.journals.deferred_merges(db):
+        while batch := list(itertools.islice(entries, batch_size)):
+            db.u("begin immediate")
+            try:
+                jour.models.journals.bulk_upsert(db, batch)
+                done += len(batch)
+                checkpoints.save(db, source, done)
+                db.u("commit")
+            except BaseException:
+                db.u("rollback")
+                raise
+            yield done
+        log.info("Merging full-text index segments")
+        jour.models.journals.optimize_indexes(db)
+    checkpoints.delete(db, source)
+    log.info(f"Imported {done} entries in {time.monotonic() - started:.1f}s")
@@ -1,3 +1,5 @@
+import argparse
+import os
 import signal
 import sys
 import types
@@ -5,14 +7,74 @@ import types
 import notch
 
 import jour.app
+import jour.db
+import jour.server
 
 notch.configure()
 
 
 def handle_sigterm(_signal: int, _frame: types.FrameType | None) -> None:
-    sys.exit()
+    # Let requests in progress finish if a server is running
+    if not jour.server.drain():
+        sys.exit()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        epilog="Each option can also be set with the environment variable in brackets."
+    )
+    parser.add_argument(
+        "--asgi",
+        action="store_true",
+        help="serve from uvicorn instead of waitress",
+    )
+    parser.add_argument(
+        "--group-commit",
+        action="store_true",
+        default=os.getenv("JOUR_GROUP_COMMIT", "").lower() in ("1", "true", "yes"),
+        help="merge concurrent saves into one transaction [JOUR_GROUP_COMMIT]",
+    )
+    options = [
+        ("--host", str, "0.0.0.0", "address to listen on"),  # noqa: S104
+        ("--port", int, "8080", "port to listen on"),
+        ("--threads", int, str(jour.app.THREADS), "threads in each process"),
+        ("--workers", int, "1", "processes sharing the port"),
+        ("--connection-limit", int, None, "most open connections per process"),
+        ("--channel-timeout", int, None, "seconds to keep an idle connection"),
+        ("--backlog", int, None, "connections waiting to be accepted"),
+        (
+            "--slow-query-ms",
+            float,
+            str(jour.db.SLOW_QUERY_MS),
+            "log statements slower than this with their query plan",
+        ),
+    ]
+    for flag, type_, default, help_ in options:
+        env = f"JOUR_{flag[2:].upper().replace('-', '_')}"
+        parser.add_argument(
+            flag, type=type_, default=os.getenv(env, default), help=f"{help_} [{env}]"
+        )
+    args = parser.parse_args()
+    if args.asgi and args.workers > 1:
+        parser.error("--workers is not supported with --asgi")
+    return args
 
 
 if __name__ == "__main__":
+    args = parse_args()
     signal.signal(signal.SIGTERM, handle_sigterm)
-    jour.app.main()
+    if args.asgi:
+        import jour.asgi
+
+        # uvicorn replaces the SIGTERM handler and finishes open requests itself
+        jour.asgi.main(
+            args.host, args.port, args.threads, args.group_commit, args.slow_query_ms
+        )
+    else:
+        options = {
+            k: v
+            for k, v in vars(args).items()
+            if k not in ("asgi", "group_commit", "slow_query_ms", "workers")
+            and v is not None
+        }
+        jour.app.main(args.workers, args.group_commit, args.slow_query_ms, **options)
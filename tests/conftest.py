@@ -0,0 +1,35 @@
+import collections.abc
+import pathlib
+
+import flask.testing
+import pytest
+
+import jour.app
+import jour.models
+
+EMAIL = "user@example.com"
+
+
+@pytest.fixture
+def client(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> collections.abc.Iterator[flask.testing.FlaskClient]:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".local").mkdir()
+    monkeypatch.setattr(jour.app, "pool", None)
+    monkeypatch.setattr(jour.app, "writer", None)
+    jour.models.settings.invalidate()
+    for name in ("_months_cache", "_search_cache"):
+        cache = jour.models.journals._SearchCache(10)
+        monkeypatch.setattr(jour.models.journals, name, cache)
+    jour.app.setup()
+    db = jour.app._get_pool().get()
+    try:
+        jour.models.settings.Settings(db).set_str("user/email", EMAIL)
+    finally:
+        jour.app._get_pool().put(db)
+    client = jour.app.app.test_client()
+    with client.session_transaction() as session:
+        session["email"] = EMAIL
+    yield client
+    jour.models.settings.invalidate()
@@ -0,0 +1,286 @@
+import collections.abc
+import datetime
+import json
+import pathlib
+import re
+
+import flask.testing
+import pytest
+
+import jour.app
+import jour.db
+import jour.models
+
+
+def _save(client: flask.testing.FlaskClient, day: str, text: str) -> None:
+    response = client.post(f"/{day}/update", data={"entry-text": text})
+    assert response.status_code == 302
+
+
+def test_search_pages_with_cursor(client: flask.testing.FlaskClient) -> None:
+    _save(client, "2026/01/02", "walked to the lake")
+    response = client.post("/search", data={"q": "lake"}, buffered=True)
+    assert response.status_code == 200
+    assert b"walked to the lake" in response.data
+    data = {"q": "lake", "after_rank": "-1e9", "after_id": ""}
+    response = client.post("/search", data=data, buffered=True)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("after_rank", ["", "soon", "nan", "inf"])
+def test_search_rejects_bad_cursor(
+    client: flask.testing.FlaskClient, after_rank: str
+) -> None:
+    data = {"q": "lake", "after_rank": after_rank}
+    response = client.post("/search", data=data, buffered=True)
+    assert response.status_code == 400
+
+
+def test_migrate_makes_secret_key_once(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".local").mkdir()
+    monkeypatch.setattr(jour.app.app, "secret_key", None)
+    jour.models.settings.invalidate()
+    jour.app._migrate()
+    key = jour.app.app.secret_key
+    assert key
+    # A worker forked afterwards, with its own connection, reads the same key
+    jour.models.settings.invalidate()
+    db = jour.db.Database(jour.app._get_db_path())
+    try:
+        assert jour.models.settings.Settings(db).secret_key == key
+    finally:
+        db.close()
+    jour.models.settings.invalidate()
+
+
+def test_writes_go_through_group_commit(
+    client: flask.testing.FlaskClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    jour.app.start(1, group_commit=True, slow_query_ms=5.0)
+    writer = jour.app.writer
+    assert writer is not None
+    assert writer.db.slow_query_ms == 5.0
+    submitted = []
+    submit = writer.submit
+
+    def record(f: collections.abc.Callable, *args: object) -> object:
+        submitted.append(f)
+        return submit(f, *args)
+
+    monkeypatch.setattr(writer, "submit", record)
+    response = client.post("/2026/01/02/draft", data={"entry-text": "draft"})
+    assert response.status_code == 200
+    _save(client, "2026/01/02", "walked to the lake")
+    response = client.post("/2026/01/02/delete")
+    assert response.status_code == 302
+    assert submitted == [
+        jour.models.drafts.save,
+        jour.app._save_entry,
+        jour.app._delete_entry,
+    ]
+    db = jour.app._get_pool().get()
+    try:
+        assert jour.models.journals.get_for_date(db, datetime.date(2026, 1, 2)) == {}
+    finally:
+        jour.app._get_pool().put(db)
+
+
+def test_day_answers_matching_etag_with_304(client: flask.testing.FlaskClient) -> None:
+    _save(client, "2026/01/02", "walked to the lake")
+    response = client.get("/2026/01/02", buffered=True)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert "HX-Target" in response.vary
+    response = client.get("/2026/01/02", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.data == b""
+    _save(client, "2026/01/02", "walked to the lake and back")
+    response = client.get("/2026/01/02", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_compressed_etag_still_matches(client: flask.testing.FlaskClient) -> None:
+    headers = {"Accept-Encoding": "gzip"}
+    response = client.get("/2026/01", headers=headers, buffered=True)
+    assert response.headers["Content-Encoding"] == "gzip"
+    etag = response.headers["ETag"]
+    assert etag.endswith('-gzip"')
+    response = client.get("/2026/01", headers=headers | {"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+@pytest.mark.parametrize("url", ["/2026/01", "/2026/01/02", "/2026/01/02/edit"])
+def test_partial_and_full_pages_have_different_etags(
+    client: flask.testing.FlaskClient, url: str
+) -> None:
+    full = client.get(url, buffered=True)
+    partial = client.get(url, headers={"HX-Target": "content"}, buffered=True)
+    assert full.status_code == partial.status_code == 200
+    assert full.headers["ETag"] != partial.headers["ETag"]
+    assert "HX-Target" in full.vary
+    assert "HX-Target" in partial.vary
+    # A partial ETag must not answer a request for the whole page
+    response = client.get(url, headers={"If-None-Match": partial.headers["ETag"]})
+    assert response.status_code == 200
+
+
+def test_go_targets_content(client: flask.testing.FlaskClient) -> None:
+    response = client.post("/go", data={"year": "2026", "month": "3"})
+    location = json.loads(response.headers["HX-Location"])
+    assert location == {"path": "/2026/03", "target": "#content"}
+
+
+def test_htmx_request_without_session_is_redirected_by_htmx(
+    client: flask.testing.FlaskClient,
+) -> None:
+    with client.session_transaction() as session:
+        session.clear()
+    response = client.get("/2026/01/02", headers={"HX-Request": "true"})
+    assert response.status_code == 204
+    assert response.headers["HX-Redirect"] == "/sign-in"
+    response = client.get("/2026/01/02")
+    assert response.status_code == 302
+
+
+def test_htmx_navigation_gets_only_the_content(
+    client: flask.testing.FlaskClient,
+) -> None:
+    _save(client, "2026/01/02", "walked to the lake")
+    full = client.get("/2026/01/02", buffered=True)
+    assert b"<head>" in full.data
+    assert b'id="content"' in full.data
+    headers = {"HX-Request": "true", "HX-Target": "content"}
+    partial = client.get("/2026/01/02", headers=headers, buffered=True)
+    assert b"<head>" not in partial.data
+    assert b'id="content"' not in partial.data
+    assert b"walked to the lake" in partial.data
+    # A history restore replaces the whole page
+    headers["HX-History-Restore-Request"] = "true"
+    restored = client.get("/2026/01/02", headers=headers, buffered=True)
+    assert restored.data == full.data
+
+
+def test_search_sentinel_targets_itself(client: flask.testing.FlaskClient) -> None:
+    for day in range(1, jour.models.journals.PAGE_SIZE + 2):
+        _save(client, f"2026/01/{day:02}", "walked to the lake")
+    response = client.post("/search", data={"q": "lake"}, buffered=True)
+    assert b'hx-target="this"' in response.data
+    assert b'hx-trigger="revealed"' in response.data
+
+
+def test_draft_is_autosaved_and_shown_in_the_editor(
+    client: flask.testing.FlaskClient,
+) -> None:
+    _save(client, "2026/01/02", "walked to the lake")
+    response = client.post("/2026/01/02/draft", data={"entry-text": "swam"})
+    assert response.status_code == 200
+    assert b"Draft saved" in response.data
+    response = client.get("/2026/01/02/edit", buffered=True)
+    assert b"swam" in response.data
+    response = client.get("/2026/01/02", buffered=True)
+    assert b"walked to the lake" in response.data
+    assert b"swam" not in response.data
+    # Saving the entry replaces the draft
+    _save(client, "2026/01/02", "swam in the lake")
+    db = jour.app._get_pool().get()
+    try:
+        assert jour.models.drafts.get_for_date(db, datetime.date(2026, 1, 2)) == {}
+    finally:
+        jour.app._get_pool().put(db)
+
+
+def test_idle_drafts_are_promoted(
+    client: flask.testing.FlaskClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    response = client.post("/2026/01/02/draft", data={"entry-text": "swam"})
+    assert response.status_code == 200
+    db = jour.app._get_pool().get()
+    try:
+        db.u("update drafts set saved_at = '2000-01-01T00:00:00.000Z'")
+    finally:
+        jour.app._get_pool().put(db)
+    sleeps = []
+
+    def sleep(seconds: float) -> None:
+        # Stop the sweep after one pass
+        if sleeps:
+            raise KeyboardInterrupt
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(jour.app.time, "sleep", sleep)
+    with pytest.raises(KeyboardInterrupt):
+        jour.app._promote_idle_drafts()
+    assert sleeps == [jour.app.DRAFT_SWEEP_INTERVAL]
+    response = client.get("/2026/01/02", buffered=True)
+    assert b"swam" in response.data
+
+
+def test_pages_are_streamed(client: flask.testing.FlaskClient) -> None:
+    text = "\n\n".join(f"paragraph {i} about the lake" for i in range(2000))
+    _save(client, "2026/01/02", text)
+    response = client.get("/2026/01/02", buffered=False)
+    assert response.is_streamed
+    assert "Content-Length" not in response.headers
+    # The request context is kept, so blocks made after the view returns can
+    # still build URLs
+    blocks = list(response.iter_encoded())
+    assert len(blocks) > 2
+    assert blocks[0].endswith(b"</head>")
+    assert b"paragraph 1999 about the lake" in b"".join(blocks)
+    response.close()
+
+
+def test_search_counts_matches_by_year(client: flask.testing.FlaskClient) -> None:
+    for day in ("2025/03/01", "2025/04/01", "2026/01/02"):
+        _save(client, day, "walked to the lake")
+    response = client.post("/search", data={"q": "lake"}, buffered=True)
+    assert b"3 entries" in response.data
+    assert b'hx-post="/search?start=2025-01-01&amp;end=2025-12-31"' in response.data
+    assert b'hx-post="/search?start=2026-01-01&amp;end=2026-12-31"' in response.data
+    assert b"Search all dates" not in response.data
+
+
+def test_search_counts_matches_by_month_within_a_year(
+    client: flask.testing.FlaskClient,
+) -> None:
+    for day in ("2026/01/02", "2026/01/03", "2026/02/01"):
+        _save(client, day, "walked to the lake")
+    response = client.post("/search", data={"q": "lake"}, buffered=True)
+    assert b"Jan 2026" in response.data
+    assert b"Feb 2026" in response.data
+    assert b'hx-post="/search?start=2026-02-01&amp;end=2026-02-28"' in response.data
+
+
+def test_search_within_dates(client: flask.testing.FlaskClient) -> None:
+    for day in range(1, jour.models.journals.PAGE_SIZE + 2):
+        _save(client, f"2026/01/{day:02}", "walked to the lake")
+    _save(client, "2025/06/01", "swam in the lake")
+    data = {"q": "lake", "start": "2026-01-01", "end": "2026-01-31"}
+    response = client.post("/search", data=data, buffered=True)
+    assert response.status_code == 200
+    assert b"walked to the lake" in response.data
+    assert b"swam in the lake" not in response.data
+    assert b"Search all dates" in response.data
+    # The next page stays within the same dates
+    sentinel = re.search(rb'hx-post="([^"]*after_rank=[^"]*)"', response.data)
+    assert sentinel is not None
+    assert b"start=2026-01-01&amp;end=2026-01-31" in sentinel.group(1)
+    data = {"q": "lake", "start": "2025-01-01", "end": "2025-12-31"}
+    response = client.post("/search", data=data, buffered=True)
+    assert b"swam in the lake" in response.data
+    assert b"walked to the lake" not in response.data
+
+
+@pytest.mark.parametrize(
+    "dates", [{"start": "2026-13-01"}, {"end": "soon"}, {"start": "01/02/2026"}]
+)
+def test_search_rejects_bad_dates(
+    client: flask.testing.FlaskClient, dates: dict[str, str]
+) -> None:
+    response = client.post("/search", data={"q": "lake", **dates}, buffered=True)
+    assert response.status_code == 400
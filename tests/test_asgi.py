@@ -0,0 +1,141 @@
+import asyncio
+import collections.abc
+
+import flask.testing
+import httpx
+import pytest
+
+import jour.app
+import jour.asgi
+import jour.models
+import jour.openid
+
+DISCOVERY_URL = "https://id.example.com/.well-known/openid-configuration"
+
+
+def _scope(path: str = "/", method: str = "GET", headers: list | None = None) -> dict:
+    return {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": headers or [],
+    }
+
+
+def _call(
+    app: jour.asgi.Application, scope: dict, messages: list[dict] | None = None
+) -> list[dict]:
+    """Run one ASGI call and return the messages the app sent."""
+    received = list(messages or [{"type": "http.request", "body": b""}])
+    sent = []
+
+    async def receive() -> dict:
+        return received.pop(0)
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def _echo(
+    environ: dict, start_response: collections.abc.Callable
+) -> collections.abc.Iterator[bytes]:
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    yield environ["wsgi.input"].read()
+    for name in ("HTTP_ACCEPT", "HTTP_COOKIE", "CONTENT_TYPE"):
+        yield f"\n{name}={environ.get(name)}".encode()
+
+
+def test_environ_joins_repeated_headers() -> None:
+    headers = [
+        (b"accept", b"text/html"),
+        (b"Accept", b"application/json"),
+        (b"cookie", b"a=1"),
+        (b"cookie", b"b=2"),
+        (b"content-type", b"text/plain"),
+        (b"x-forwarded-for", b"10.0.0.1"),
+    ]
+    environ = jour.asgi._environ(_scope(headers=headers), b"body")
+    assert environ["HTTP_ACCEPT"] == "text/html,application/json"
+    assert environ["HTTP_COOKIE"] == "a=1; b=2"
+    assert environ["CONTENT_TYPE"] == "text/plain"
+    assert environ["CONTENT_LENGTH"] == "4"
+    assert environ["HTTP_X_FORWARDED_FOR"] == "10.0.0.1"
+
+
+def test_lifespan() -> None:
+    app = jour.asgi.Application(_echo, 1)
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = _call(app, {"type": "lifespan"}, messages)
+    assert sent == [
+        {"type": "lifespan.startup.complete"},
+        {"type": "lifespan.shutdown.complete"},
+    ]
+    assert app.executor._shutdown
+
+
+def test_request_body_is_read_in_parts() -> None:
+    app = jour.asgi.Application(_echo, 1)
+    messages = [
+        {"type": "http.request", "body": b"one ", "more_body": True},
+        {"type": "http.request", "body": b"two", "more_body": False},
+    ]
+    headers = [(b"cookie", b"a=1"), (b"cookie", b"b=2")]
+    sent = _call(app, _scope(method="POST", headers=headers), messages)
+    assert sent[0] == {
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/plain")],
+    }
+    body = b"".join(m["body"] for m in sent[1:])
+    assert body == b"one two\nHTTP_ACCEPT=None\nHTTP_COOKIE=a=1; b=2\nCONTENT_TYPE=None"
+
+
+def test_streamed_body_is_sent_chunk_by_chunk() -> None:
+    app = jour.asgi.Application(_echo, 1)
+    sent = _call(app, _scope(), [{"type": "http.request", "body": b"first"}])
+    bodies = [m for m in sent if m["type"] == "http.response.body"]
+    assert [m["body"] for m in bodies[:2]] == [b"first", b"\nHTTP_ACCEPT=None"]
+    assert all(m["more_body"] for m in bodies[:-1])
+    assert bodies[-1] == {"type": "http.response.body", "body": b""}
+
+
+def test_sign_in_runs_one_request_context(
+    client: flask.testing.FlaskClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    fetched = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        fetched.append(str(request.url))
+        document = {"authorization_endpoint": "https://id.example.com/auth"}
+        return httpx.Response(200, json=document)
+
+    transport = httpx.MockTransport(handle)
+    provider = jour.openid.Provider(
+        client=httpx.Client(transport=transport),
+        async_client=httpx.AsyncClient(transport=transport),
+    )
+    monkeypatch.setattr(jour.openid, "provider", provider)
+    db = jour.app._get_pool().get()
+    try:
+        jour.models.settings.Settings(db).openid_discovery_document = DISCOVERY_URL
+    finally:
+        jour.app._get_pool().put(db)
+    preprocessed = []
+    preprocess_request = jour.app.app.preprocess_request
+
+    def count_preprocess_request() -> object:
+        preprocessed.append(flask.request.path)
+        return preprocess_request()
+
+    monkeypatch.setattr(jour.app.app, "preprocess_request", count_preprocess_request)
+    sent = _call(jour.asgi.Application(jour.app.app, 1), _scope("/sign-in"))
+    assert sent[0]["status"] == 307
+    location = dict(sent[0]["headers"])[b"location"]
+    assert location.startswith(b"https://id.example.com/auth?")
+    assert preprocessed == ["/sign-in"]
+    assert fetched == [DISCOVERY_URL]
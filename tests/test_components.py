@@ -0,0 +1,25 @@
+import htpy
+import pytest
+
+import jour.components
+
+
+@pytest.fixture
+def page() -> htpy.Node:
+    paragraphs = [htpy.p[f"paragraph {i} " * 20] for i in range(500)]
+    return htpy.html[htpy.head[htpy.title["a day"]], htpy.body[paragraphs]]
+
+
+def test_blocks_join_to_the_whole_page(page: htpy.Node) -> None:
+    assert "".join(jour.components._blocks(page)) == str(page)
+
+
+def test_head_is_a_block_of_its_own(page: htpy.Node) -> None:
+    blocks = list(jour.components._blocks(page))
+    assert blocks[0].endswith("</head>")
+    assert "<body>" not in blocks[0]
+    assert len(blocks) > 2
+    for block in blocks[1:-1]:
+        assert len(block) >= jour.components.STREAM_CHUNK_SIZE
+        # Blocks end at the first chunk past the size, not far beyond it
+        assert len(block) < 2 * jour.components.STREAM_CHUNK_SIZE
@@ -0,0 +1,176 @@
+import collections.abc
+import gzip
+import zlib
+
+import pytest
+import werkzeug.test
+
+import jour.compress
+
+PAGE = b"<p>walked to the lake before breakfast</p>\n" * 100
+ETAG = '"abc"'
+
+
+class App:
+    """A WSGI app that serves one page with an ETag and answers If-None-Match."""
+
+    def __init__(self) -> None:
+        self.closed = 0
+        self.content_type = "text/html; charset=utf-8"
+        self.etag: str | None = ETAG
+        self.streamed = False
+
+    def __call__(
+        self, environ: dict, start_response: collections.abc.Callable
+    ) -> collections.abc.Iterable[bytes]:
+        headers = [("Content-Type", self.content_type)]
+        if self.etag:
+            headers.append(("ETag", self.etag))
+            if environ.get("HTTP_IF_NONE_MATCH") == self.etag:
+                start_response("304 Not Modified", headers)
+                return []
+        if self.streamed:
+            start_response("200 OK", headers)
+            return Body(self, [b"<p>first</p>", b"<p>second</p>" * 100])
+        headers.append(("Content-Length", str(len(PAGE))))
+        start_response("200 OK", headers)
+        return Body(self, [PAGE])
+
+
+class Body:
+    def __init__(self, app: App, chunks: list[bytes]) -> None:
+        self.app = app
+        self.chunks = chunks
+
+    def __iter__(self) -> collections.abc.Iterator[bytes]:
+        return iter(self.chunks)
+
+    def close(self) -> None:
+        self.app.closed += 1
+
+
+class CountingGzip(jour.compress._Gzip):
+    made = 0
+
+    def __init__(self) -> None:
+        super().__init__()
+        CountingGzip.made += 1
+
+
+@pytest.fixture
+def app() -> App:
+    return App()
+
+
+@pytest.fixture
+def middleware(app: App) -> jour.compress.CompressionMiddleware:
+    CountingGzip.made = 0
+    middleware = jour.compress.CompressionMiddleware(app)
+    middleware.encodings = {"gzip": CountingGzip}
+    return middleware
+
+
+def _get(
+    middleware: jour.compress.CompressionMiddleware, **headers: str
+) -> werkzeug.test.TestResponse:
+    client = werkzeug.test.Client(middleware)
+    return client.get("/", headers={k.replace("_", "-"): v for k, v in headers.items()})
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    cache = jour.compress._CompressedCache(10)
+    cache.put(("a", "gzip"), b"1234")
+    cache.put(("b", "gzip"), b"1234")
+    assert cache.get(("a", "gzip")) == b"1234"
+    cache.put(("c", "gzip"), b"1234")
+    assert cache.get(("b", "gzip")) is None
+    assert cache.get(("a", "gzip")) == b"1234"
+    assert cache.size == 8
+    cache.put(("d", "gzip"), b"x" * 11)
+    assert cache.get(("d", "gzip")) is None
+
+
+def test_cached_body_is_reused(
+    app: App, middleware: jour.compress.CompressionMiddleware
+) -> None:
+    first = _get(middleware, Accept_Encoding="gzip").data
+    second = _get(middleware, Accept_Encoding="gzip")
+    assert CountingGzip.made == 1
+    assert second.data == first
+    assert second.headers["Content-Length"] == str(len(first))
+    assert gzip.decompress(second.data) == PAGE
+    assert app.closed == 2
+
+
+def test_compresses_with_gzip(
+    app: App, middleware: jour.compress.CompressionMiddleware
+) -> None:
+    response = _get(middleware, Accept_Encoding="gzip")
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["ETag"] == '"abc-gzip"'
+    assert gzip.decompress(response.data) == PAGE
+    assert app.closed == 1
+
+
+@pytest.mark.parametrize(
+    "accept_encoding", ["", "identity", "gzip;q=0", "deflate", "br;q=1"]
+)
+def test_passes_through_when_nothing_is_accepted(
+    middleware: jour.compress.CompressionMiddleware, accept_encoding: str
+) -> None:
+    response = _get(middleware, Accept_Encoding=accept_encoding)
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["ETag"] == ETAG
+    assert response.data == PAGE
+
+
+@pytest.mark.parametrize(
+    ("content_type", "etag"),
+    [("image/png", ETAG), ("text/plain", None)],
+)
+def test_passes_through_uncompressible_or_small(
+    app: App, content_type: str, etag: str | None
+) -> None:
+    app.content_type = content_type
+    app.etag = etag
+    middleware = jour.compress.CompressionMiddleware(app, min_size=len(PAGE) + 1)
+    response = _get(middleware, Accept_Encoding="gzip")
+    assert "Content-Encoding" not in response.headers
+    assert response.data == PAGE
+
+
+def test_prefers_first_supported_encoding(app: App) -> None:
+    middleware = jour.compress.CompressionMiddleware(app)
+    best = next(iter(middleware.encodings))
+    response = _get(middleware, Accept_Encoding="gzip, br, zstd")
+    assert response.headers["Content-Encoding"] == best
+    assert response.headers["ETag"] == f'"abc-{best}"'
+
+
+def test_streamed_body_is_flushed_per_chunk(
+    app: App, middleware: jour.compress.CompressionMiddleware
+) -> None:
+    app.streamed = True
+    client = werkzeug.test.Client(middleware)
+    response = client.get("/", headers={"Accept-Encoding": "gzip"}, buffered=False)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    chunks = response.iter_encoded()
+    d = zlib.decompressobj(31)
+    # The first chunk can be decoded before the rest of the body is made
+    assert d.decompress(next(chunks)) == b"<p>first</p>"
+    rest = b"".join(d.decompress(chunk) for chunk in chunks) + d.flush()
+    assert rest == b"<p>second</p>" * 100
+    response.close()
+    assert app.closed == 1
+
+
+def test_suffixed_etag_is_not_modified(
+    app: App, middleware: jour.compress.CompressionMiddleware
+) -> None:
+    response = _get(middleware, Accept_Encoding="gzip", If_None_Match='"abc-gzip"')
+    assert response.status_code == 304
+    assert response.headers["ETag"] == '"abc-gzip"'
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.data == b""
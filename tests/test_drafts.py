@@ -0,0 +1,78 @@
+import datetime
+import pathlib
+import uuid
+
+import pytest
+
+import jour.db
+import jour.models
+from jour.models import drafts
+
+DATE = datetime.date(2026, 1, 2)
+
+
+@pytest.fixture
+def db(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> jour.db.Database:
+    for name in ("_months_cache", "_search_cache"):
+        cache = jour.models.journals._SearchCache(10)
+        monkeypatch.setattr(jour.models.journals, name, cache)
+    db = jour.db.Database(str(tmp_path / "jour.db"))
+    jour.models.init(db)
+    return db
+
+
+def _age(db: jour.db.Database, seconds: int) -> None:
+    """Move the autosave time of every draft into the past."""
+    sql = """
+        update drafts
+        set saved_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now', :age)
+    """
+    db.u(sql, {"age": f"-{seconds} seconds"})
+
+
+def test_save_keeps_text_apart_from_the_entry(db: jour.db.Database) -> None:
+    drafts.save(db, DATE, "walked to the")
+    draft = drafts.get_for_date(db, DATE)
+    assert draft["draft_data"] == "walked to the"
+    assert jour.models.journals.get_for_date(db, DATE) == {}
+    assert jour.models.journals.search(db, "walked") == []
+
+
+def test_save_same_text_again_writes_nothing(db: jour.db.Database) -> None:
+    drafts.save(db, DATE, "walked to the")
+    _age(db, 10)
+    saved_at = drafts.get_for_date(db, DATE)["saved_at"]
+    drafts.save(db, DATE, "walked to the")
+    assert drafts.get_for_date(db, DATE)["saved_at"] == saved_at
+    drafts.save(db, DATE, "walked to the lake")
+    assert drafts.get_for_date(db, DATE)["saved_at"] > saved_at
+
+
+def test_save_text_of_the_entry_deletes_the_draft(db: jour.db.Database) -> None:
+    params = {"journal_id": uuid.uuid4(), "journal_date": DATE, "journal_data": "x"}
+    jour.models.journals.upsert(db, params)
+    drafts.save(db, DATE, "x y")
+    assert drafts.get_for_date(db, DATE)
+    drafts.save(db, DATE, "x")
+    assert drafts.get_for_date(db, DATE) == {}
+
+
+def test_list_idle_after_idle_timeout(db: jour.db.Database) -> None:
+    drafts.save(db, DATE, "walked to the")
+    assert drafts.list_idle(db) == []
+    _age(db, drafts.IDLE_TIMEOUT - 10)
+    assert drafts.list_idle(db) == []
+    _age(db, drafts.IDLE_TIMEOUT + 1)
+    assert drafts.list_idle(db) == [DATE]
+
+
+def test_promote_saves_the_draft_as_the_entry(db: jour.db.Database) -> None:
+    drafts.save(db, DATE, "walked to the lake")
+    drafts.promote(db, DATE)
+    entry = jour.models.journals.get_for_date(db, DATE)
+    assert entry["journal_data"] == "walked to the lake"
+    assert drafts.get_for_date(db, DATE) == {}
+    assert len(jour.models.journals.search(db, "lake")) == 1
+    # A draft that is gone by the time it is promoted leaves the entry alone
+    drafts.promote(db, DATE)
+    assert jour.models.journals.get_for_date(db, DATE) == entry
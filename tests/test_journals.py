@@ -0,0 +1,52 @@
+import collections.abc
+import datetime
+import pathlib
+import uuid
+
+import pytest
+
+import jour.db
+import jour.models
+
+
+@pytest.fixture
+def dsn(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> collections.abc.Iterator[str]:
+    for name in ("_months_cache", "_search_cache"):
+        cache = jour.models.journals._SearchCache(10)
+        monkeypatch.setattr(jour.models.journals, name, cache)
+    dsn = str(tmp_path / "jour.db")
+    db = jour.db.Database(dsn)
+    jour.models.init(db)
+    db.close()
+    yield dsn
+
+
+def _upsert(db: jour.db.Database, date: datetime.date, text: str) -> None:
+    params = {"journal_id": uuid.uuid4(), "journal_date": date, "journal_data": text}
+    jour.models.journals.upsert(db, params)
+
+
+def test_search_cache_sees_writes_from_other_connections(dsn: str) -> None:
+    # Each connection stands in for a separate process
+    reader, writer = jour.db.Database(dsn), jour.db.Database(dsn)
+    _upsert(writer, datetime.date(2026, 1, 1), "walked to the lake")
+    assert len(jour.models.journals.search(reader, "lake")) == 1
+    assert jour.models.journals.count_by_month(reader, "lake") == {"2026-01": 1}
+    _upsert(writer, datetime.date(2026, 2, 1), "swam in the lake")
+    assert len(jour.models.journals.search(reader, "lake")) == 2
+    assert jour.models.journals.count_by_month(reader, "lake") == {
+        "2026-01": 1,
+        "2026-02": 1,
+    }
+    jour.models.journals.delete(writer, datetime.date(2026, 1, 1))
+    assert len(jour.models.journals.search(reader, "lake")) == 1
+
+
+def test_unchanged_upsert_keeps_cached_results(dsn: str) -> None:
+    db = jour.db.Database(dsn)
+    _upsert(db, datetime.date(2026, 1, 1), "walked to the lake")
+    first = jour.models.journals.search(db, "lake")
+    _upsert(db, datetime.date(2026, 1, 1), "walked to the lake")
+    assert jour.models.journals.search(db, "lake") is first
@@ -0,0 +1,81 @@
+import random
+
+import lxml.html
+import markdown
+import pytest
+
+import jour.components
+
+CORPUS = [
+    "",
+    "plain text",
+    "# Heading\n\nA paragraph with **bold**, _em_ and `code`.",
+    "> quoted\n>\n> > nested quote",
+    "* one\n* two\n\n1. first\n2. second",
+    "    indented code & <tags>\n",
+    '```\nfenced "code" & more\n```',
+    "line one  \nline two\n\n---\n\nafter the rule",
+    "caf&eacute; &copy; &#169; &#xA9; &amp; &lt; &gt; &quot; &nosuchref; & alone",
+    "control &#1; &#127; &#xfffe; and invalid &#0; &#128; &#x110000; references",
+    "`&copy; &quot; <b>` in a code span",
+    "quotes \"double\" and 'single' and < > in text",
+    "non-ASCII: café, 日本, emoji 🎉",
+    "[link](https://example.com/a?b=1&c=2)",
+    '[titled](https://example.com "a title")',
+    '[quoted title](https://example.com "say \\"hi\\"")',
+    "[spaces](<https://example.com/a b>)",
+    "[accent](https://example.com/café)",
+    "[entity](https://example.com/?q=&quot;x&quot; '&quot;&eacute;')",
+    '![alt "q"](image.png)',
+    "![a < b & c](images/ümlaut.png)",
+    "![it's](image.png 'single')",
+    "![alt](a.png)",
+    '[title](x "title")',
+    "[x](href) and ![src](src)",
+    "<https://example.com/auto> and <someone@example.com>",
+    "<blockquote>raw quote</blockquote>",
+    '<blockquote class="foo">raw quote with a class</blockquote>',
+    "<div>\n<blockquote>\nraw inside a div\n</blockquote>\n</div>",
+    "text with <a href='x'>single quoted</a> raw attributes",
+    '<a href="a b" title="t &quot;x&quot;">raw link</a>',
+    "<b>bold</b> and <i>italic</i> inline",
+    "<!-- a comment -->\n\nafter a comment",
+    "<br/> self closing <hr/>",
+    "a <span>span with &eacute;</span> in text",
+    "> quote with <em>inline html</em> and a [link](x 'y')",
+]
+
+
+def _render_with_lxml(t: str) -> str:
+    """Render an entry the way jour did before dropping the lxml round trip."""
+    md = markdown.Markdown()
+    doc = lxml.html.fragment_fromstring(md.convert(t), create_parent="div")
+    for el in doc.xpath("//blockquote"):
+        el.classes.update(("border-3", "border-start", "ps-2"))
+    return lxml.html.tostring(doc, encoding="unicode")
+
+
+@pytest.fixture(autouse=True)
+def _no_md_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(jour.components, "_md_cache", jour.components._RenderCache(0))
+
+
+def _render(t: str) -> str:
+    return str(jour.components._md(t))
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_md_matches_lxml(text: str) -> None:
+    assert _render(text) == _render_with_lxml(text)
+
+
+def test_md_matches_lxml_on_mixed_entries() -> None:
+    rng = random.Random(0)  # noqa: S311
+    for _ in range(200):
+        text = "\n\n".join(rng.choices(CORPUS, k=rng.randint(1, 8)))
+        assert _render(text) == _render_with_lxml(text)
+
+
+def test_md_styles_raw_blockquotes() -> None:
+    rendered = _render('<blockquote class="foo">quote</blockquote>')
+    assert 'class="foo border-3 border-start ps-2"' in rendered
@@ -0,0 +1,82 @@
+import flask.testing
+import pytest
+import werkzeug.test
+
+import jour.app
+import jour.metrics
+import jour.models
+
+TOKEN = "scrape-token"  # noqa: S105
+
+
+@pytest.fixture(autouse=True)
+def _histograms(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(jour.metrics, "_histograms", {})
+
+
+def _set_token(token: str) -> None:
+    db = jour.app._get_pool().get()
+    try:
+        jour.models.settings.Settings(db).metrics_token = token
+    finally:
+        jour.app._get_pool().put(db)
+
+
+def _timings(response: werkzeug.test.TestResponse) -> dict[str, float]:
+    timings = {}
+    for metric in response.headers["Server-Timing"].split(", "):
+        name, _, duration = metric.partition(";dur=")
+        timings[name] = float(duration)
+    return timings
+
+
+def test_render_histogram() -> None:
+    for seconds in (0.0005, 0.003, 2.0):
+        jour.metrics._histograms.setdefault(
+            ("/a", 'say "hi"'), jour.metrics._Histogram()
+        ).observe(seconds)
+    lines = jour.metrics.render().splitlines()
+    labels = 'route="/a",phase="say \\"hi\\""'
+    name = jour.metrics.NAME
+    assert f'{name}_bucket{{{labels},le="0.0005"}} 1' in lines
+    assert f'{name}_bucket{{{labels},le="0.001"}} 1' in lines
+    assert f'{name}_bucket{{{labels},le="0.005"}} 2' in lines
+    assert f'{name}_bucket{{{labels},le="1.0"}} 2' in lines
+    assert f'{name}_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f"{name}_sum{{{labels}}} 2.0035" in lines
+    assert f"{name}_count{{{labels}}} 3" in lines
+
+
+def test_phase_outside_a_request_does_nothing() -> None:
+    with jour.metrics.phase("db"):
+        pass
+    assert jour.metrics._histograms == {}
+
+
+def test_response_has_server_timing(client: flask.testing.FlaskClient) -> None:
+    response = client.get("/2026/01/02", buffered=True)
+    timings = _timings(response)
+    assert {"setup", "db", "total"} <= timings.keys()
+    assert timings["total"] >= timings["db"]
+    # The streamed body is timed as render once it has been sent
+    route = "/<year>/<month_>/<day_>"
+    assert sum(jour.metrics._histograms[(route, "total")].counts) == 1
+    assert sum(jour.metrics._histograms[(route, "render")].counts) == 1
+
+
+def test_metrics_needs_a_token(client: flask.testing.FlaskClient) -> None:
+    assert client.get("/metrics").status_code == 404
+    _set_token(TOKEN)
+    response = client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+def test_metrics_are_served_with_the_token(client: flask.testing.FlaskClient) -> None:
+    _set_token(TOKEN)
+    client.get("/2026/01/02", buffered=True)
+    response = client.get("/metrics", headers={"Authorization": f"Bearer {TOKEN}"})
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    labels = 'route="/<year>/<month_>/<day_>",phase="db"'
+    assert f"{jour.metrics.NAME}_count{{{labels}}} 1" in response.text
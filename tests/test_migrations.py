@@ -0,0 +1,48 @@
+import collections.abc
+import pathlib
+
+import pytest
+
+import jour.db
+import jour.models
+from jour.models import migrations
+
+
+def _interrupt_after(
+    migration: collections.abc.Callable, steps: int
+) -> collections.abc.Callable:
+    def interrupted(db: jour.db.Database) -> collections.abc.Iterator[None]:
+        for i, _ in enumerate(migration(db)):
+            if i == steps:
+                raise KeyboardInterrupt
+            yield
+
+    return interrupted
+
+
+@pytest.mark.parametrize("steps", range(1, 8))
+def test_interrupted_index_rebuild_is_resumed(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, steps: int
+) -> None:
+    db = jour.db.Database(str(tmp_path / "jour.db"))
+    monkeypatch.setattr(migrations, "BATCH_SIZE", 2)
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:2])
+    migrations.migrate(db)
+    for day in range(1, 6):
+        sql = """
+            insert into journals (journal_id, journal_date, journal_data)
+            values (:journal_id, :journal_date, 'walked to the lake')
+        """
+        db.u(sql, {"journal_id": f"id-{day}", "journal_date": f"2026-01-0{day}"})
+    monkeypatch.undo()
+    monkeypatch.setattr(migrations, "BATCH_SIZE", 2)
+    interrupted = list(migrations.MIGRATIONS)
+    interrupted[2] = _interrupt_after(interrupted[2], steps)
+    monkeypatch.setattr(migrations, "MIGRATIONS", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        migrations.migrate(db)
+    monkeypatch.undo()
+    migrations.migrate(db)
+    for table in ("journals_fts", "journals_trigram"):
+        sql = f"select count(*) from {table} where {table} match 'lake'"  # noqa: S608
+        assert db.q_val(sql) == 5
@@ -0,0 +1,167 @@
+import asyncio
+import collections.abc
+import time
+
+import httpx
+import jwt
+import jwt.algorithms
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import jour.openid
+
+DISCOVERY_URL = "https://id.example.com/.well-known/openid-configuration"
+JWKS_URL = "https://id.example.com/jwks"
+
+
+class StubProvider:
+    """An OpenID provider that serves its documents through a MockTransport."""
+
+    def __init__(self) -> None:
+        self.cache_control = "max-age=300"
+        self.keys: dict[str, rsa.RSAPrivateKey] = {}
+        self.requests: list[str] = []
+        self.rotations = 0
+        self.rotate()
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        self.requests.append(url)
+        headers = {"cache-control": self.cache_control}
+        if url == DISCOVERY_URL:
+            document = {
+                "id_token_signing_alg_values_supported": ["RS256"],
+                "issuer": "https://id.example.com",
+                "jwks_uri": JWKS_URL,
+            }
+            return httpx.Response(200, json=document, headers=headers)
+        if url == JWKS_URL:
+            keys = [
+                jwt.algorithms.RSAAlgorithm.to_jwk(k.public_key(), as_dict=True)
+                | {"kid": kid, "use": "sig"}
+                for kid, k in self.keys.items()
+            ]
+            return httpx.Response(200, json={"keys": keys}, headers=headers)
+        return httpx.Response(404)
+
+    def provider(self) -> jour.openid.Provider:
+        transport = httpx.MockTransport(self.handle)
+        return jour.openid.Provider(
+            client=httpx.Client(transport=transport),
+            async_client=httpx.AsyncClient(transport=transport),
+        )
+
+    def rotate(self) -> str:
+        """Replace the signing key and return the id of the new one."""
+        self.rotations += 1
+        kid = f"key-{self.rotations}"
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.keys = {kid: key}
+        return kid
+
+    def token(self, kid: str | None) -> str:
+        key = next(iter(self.keys.values()))
+        claims = {
+            "aud": "client",
+            "email": "user@example.com",
+            "exp": int(time.time()) + 60,
+            "iss": "https://id.example.com",
+        }
+        headers = {} if kid is None else {"kid": kid}
+        return jwt.encode(claims, key, algorithm="RS256", headers=headers)
+
+
+@pytest.fixture
+def stub() -> StubProvider:
+    return StubProvider()
+
+
+def _wait_for(condition: collections.abc.Callable[[], bool]) -> None:
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_aget_json_fetches_on_event_loop(stub: StubProvider) -> None:
+    provider = stub.provider()
+    document = asyncio.run(provider.aget_json(DISCOVERY_URL))
+    assert document["jwks_uri"] == JWKS_URL
+    assert provider.discovery_document(DISCOVERY_URL) is document
+    assert stub.requests == [DISCOVERY_URL]
+
+
+def test_decode_id_token_refetches_for_unknown_kid(stub: StubProvider) -> None:
+    provider = stub.provider()
+    kid = next(iter(stub.keys))
+    claims = provider.decode_id_token(DISCOVERY_URL, stub.token(kid), "client")
+    assert claims["email"] == "user@example.com"
+    new_kid = stub.rotate()
+    claims = provider.decode_id_token(DISCOVERY_URL, stub.token(new_kid), "client")
+    assert claims["email"] == "user@example.com"
+    assert stub.requests == [DISCOVERY_URL, JWKS_URL, JWKS_URL]
+
+
+def test_decode_id_token_rejects_missing_kid(stub: StubProvider) -> None:
+    provider = stub.provider()
+    stub.rotate()
+    with pytest.raises(jwt.InvalidKeyError):
+        provider.decode_id_token(DISCOVERY_URL, stub.token("missing"), "client")
+
+
+def test_decode_id_token_refetches_once_per_interval(
+    stub: StubProvider, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    provider = stub.provider()
+    for kid in ("made-up-1", "made-up-2", "made-up-3"):
+        with pytest.raises(jwt.InvalidKeyError):
+            provider.decode_id_token(DISCOVERY_URL, stub.token(kid), "client")
+    assert stub.requests == [DISCOVERY_URL, JWKS_URL, JWKS_URL]
+    monkeypatch.setattr(jour.openid, "KEYSET_REFETCH_INTERVAL", 0)
+    new_kid = stub.rotate()
+    claims = provider.decode_id_token(DISCOVERY_URL, stub.token(new_kid), "client")
+    assert claims["email"] == "user@example.com"
+    assert stub.requests == [DISCOVERY_URL, JWKS_URL, JWKS_URL, JWKS_URL]
+
+
+def test_decode_id_token_without_kid_uses_cache(stub: StubProvider) -> None:
+    provider = stub.provider()
+    for _ in range(3):
+        claims = provider.decode_id_token(DISCOVERY_URL, stub.token(None), "client")
+        assert claims["email"] == "user@example.com"
+    assert stub.requests == [DISCOVERY_URL, JWKS_URL]
+
+
+def test_discovery_document_is_cached(stub: StubProvider) -> None:
+    provider = stub.provider()
+    first = provider.discovery_document(DISCOVERY_URL)
+    assert provider.discovery_document(DISCOVERY_URL) is first
+    assert stub.requests == [DISCOVERY_URL]
+
+
+@pytest.mark.parametrize(
+    ("cache_control", "expected"),
+    [
+        ("", jour.openid.DEFAULT_MAX_AGE),
+        ("public, max-age=60", 60),
+        ('max-age="120"', 120),
+        ("max-age=-5", 0),
+        ("max-age=soon", jour.openid.DEFAULT_MAX_AGE),
+        ("no-cache", 0),
+        ("No-Store", 0),
+    ],
+)
+def test_max_age(cache_control: str, expected: int) -> None:
+    headers = {"cache-control": cache_control} if cache_control else {}
+    response = httpx.Response(200, headers=headers)
+    assert jour.openid._max_age(response) == expected
+
+
+def test_stale_document_is_refreshed_in_background(stub: StubProvider) -> None:
+    stub.cache_control = "no-store"
+    provider = stub.provider()
+    first = provider.discovery_document(DISCOVERY_URL)
+    # The stale copy is returned at once, and a fresh one is fetched behind it
+    assert provider.discovery_document(DISCOVERY_URL) is first
+    _wait_for(lambda: provider._documents[DISCOVERY_URL][0] is not first)
+    assert stub.requests == [DISCOVERY_URL, DISCOVERY_URL]
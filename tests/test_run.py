@@ -0,0 +1,33 @@
+import pytest
+
+import run
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        (None, False),
+        ("", False),
+        ("0", False),
+        ("false", False),
+        ("no", False),
+        ("1", True),
+        ("true", True),
+        ("Yes", True),
+    ],
+)
+def test_group_commit_from_environment(
+    monkeypatch: pytest.MonkeyPatch, value: str | None, expected: bool
+) -> None:
+    monkeypatch.setattr("sys.argv", ["run.py"])
+    if value is None:
+        monkeypatch.delenv("JOUR_GROUP_COMMIT", raising=False)
+    else:
+        monkeypatch.setenv("JOUR_GROUP_COMMIT", value)
+    assert run.parse_args().group_commit is expected
+
+
+def test_group_commit_flag(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("sys.argv", ["run.py", "--group-commit"])
+    monkeypatch.setenv("JOUR_GROUP_COMMIT", "0")
+    assert run.parse_args().group_commit is True
@@ -0,0 +1,48 @@
+import logging
+
+import pytest
+
+import jour.server
+
+
+class Exited(Exception):
+    def __init__(self, status: int) -> None:
+        super().__init__(status)
+        self.status = status
+
+
+def _exit(status: int) -> None:
+    raise Exited(status)
+
+
+def _run_worker(monkeypatch: pytest.MonkeyPatch, error: BaseException) -> int:
+    """Run the worker side of a fork whose serve raises error, and return its
+    exit status."""
+
+    def serve(*_args: object, **_kw: object) -> None:
+        raise error
+
+    monkeypatch.setattr(jour.server.os, "fork", lambda: 0)
+    monkeypatch.setattr(jour.server.os, "_exit", _exit)
+    monkeypatch.setattr(jour.server, "_listen", lambda *_args: None)
+    monkeypatch.setattr(jour.server, "serve", serve)
+    with pytest.raises(Exited) as exited:
+        jour.server._start_worker(lambda *_args: [], lambda: None, "", 0, 1)
+    return exited.value.status
+
+
+def test_worker_exits_cleanly_on_sigterm_before_serving(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    # The SIGTERM handler calls sys.exit when there is no server to drain
+    assert not jour.server.drain()
+    assert _run_worker(monkeypatch, SystemExit()) == 0
+    assert not caplog.records
+
+
+def test_worker_failure_is_logged(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    with caplog.at_level(logging.ERROR):
+        assert _run_worker(monkeypatch, OSError("address in use")) == 1
+    assert "failed" in caplog.text
@@ -0,0 +1,63 @@
+import json
+import pathlib
+
+import pytest
+
+import jour.db
+import jour.models
+import jour.transfer
+
+
+@pytest.fixture
+def db(tmp_path: pathlib.Path) -> jour.db.Database:
+    db = jour.db.Database(str(tmp_path / "jour.db"))
+    jour.models.init(db)
+    return db
+
+
+@pytest.fixture
+def path(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / "entries.jsonl"
+    with path.open("w", encoding="utf-8") as f:
+        for day in range(1, 8):
+            record = {"journal_date": f"2026-01-0{day}", "journal_data": f"day {day}"}
+            f.write(f"{json.dumps(record)}\n")
+    return path
+
+
+def _automerge(db: jour.db.Database) -> list[int]:
+    sql = "select v from journals_fts_config where k = 'automerge'"
+    return [row["v"] for row in db.q(sql)]
+
+
+def _count(db: jour.db.Database) -> int:
+    return db.q_val("select count(*) from journals")
+
+
+def test_interrupted_import_resumes(db: jour.db.Database, path: pathlib.Path) -> None:
+    settings_version = jour.models.settings.Settings(db)._get("settings/version")
+    entries = jour.transfer.import_entries(db, "jsonl", path, batch_size=3)
+    assert next(entries) == 3
+    assert _automerge(db) == [0]
+    entries.close()
+    assert _automerge(db) == [jour.models.journals.FTS_AUTOMERGE]
+    source = f"jsonl/{path.resolve()}"
+    assert jour.models.import_checkpoints.get(db, source) == 3
+    assert _count(db) == 3
+    entries = jour.transfer.import_entries(db, "jsonl", path, batch_size=3)
+    assert list(entries) == [6, 7]
+    assert _count(db) == 7
+    assert jour.models.import_checkpoints.get(db, source) == 0
+    jour.models.settings.invalidate()
+    settings = jour.models.settings.Settings(db)
+    assert settings._get("settings/version") == settings_version
+
+
+def test_failed_import_restores_automerge(
+    db: jour.db.Database, path: pathlib.Path
+) -> None:
+    path.write_text(path.read_text() + "not json\n")
+    with pytest.raises(json.JSONDecodeError):
+        list(jour.transfer.import_entries(db, "jsonl", path, batch_size=3))
+    assert _automerge(db) == [jour.models.journals.FTS_AUTOMERGE]
+    assert not db.cnx.in_transaction